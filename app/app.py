@@ -44,10 +44,23 @@ class Application():
         self.lowerPanel.addWidget(self.listVariables)
         self.lowerPanel.addWidget(self.buttonApply)
 
+        self.scriptPanel = QHBoxLayout()
+        self.scriptInput = QLineEdit()
+        self.scriptInput.setPlaceholderText(lang_ui['script'])
+        self.scriptInput.setEnabled(False)
+        self.buttonRun = QPushButton(lang_ui['run'])
+        self.buttonRun.setEnabled(False)
+        self.scriptPanel.addWidget(self.scriptInput)
+        self.scriptPanel.addWidget(self.buttonRun)
+
+        self.statusBar = QStatusBar()
+
         self.mainPanel = QVBoxLayout()
         self.mainPanel.addLayout(self.upperPanel)
         self.mainPanel.addWidget(self.middleArea)
         self.mainPanel.addLayout(self.lowerPanel)
+        self.mainPanel.addLayout(self.scriptPanel)
+        self.mainPanel.addWidget(self.statusBar)
 
         self.window.setLayout(self.mainPanel)
         self.window.resize(self.defaultWidth, self.defaultHeight)
@@ -76,6 +89,11 @@ class Application():
         self.listVariables.setEnabled(True)
         self.listVariables.addItems(var_names)
         self.buttonApply.setEnabled(True)
+        self.scriptInput.setEnabled(True)
+        self.buttonRun.setEnabled(True)
+
+    def updateStatusBar(self, text):
+        self.statusBar.showMessage(text)
 
     def start(self):
         sys.exit(self.app.exec_())
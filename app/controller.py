@@ -1,4 +1,9 @@
+from os import environ
 from logic.propositions import *
+from logic.metrics import metrics
+from logic.cache import CnfCache
+from logic.davisputnam import DratLog, apply_operation, run_script
+from logic.proof import DratWriter
 from app.lang import *
 
 # application controller
@@ -7,6 +12,21 @@ class Controller:
         self.app = app
         # not much in the model, so we store it here
         self.prop_history = []
+        # operation keys by displayed name
+        self._operationKeys = dict((v, k) for (k, v) in lang_operations.items())
+        # CNF conversions are cached on disk when LOGICVIEW_CACHE is a directory
+        self.cache = None
+        if "LOGICVIEW_CACHE" in environ:
+            self.cache = CnfCache(environ["LOGICVIEW_CACHE"])
+        # Davis & Putnam sessions are logged as DRAT proofs when LOGICVIEW_PROOF
+        # is a path, check it with logic.proof.check_proof(parsed proposition, path)
+        self.proof = None
+
+    # report size of the current CNF table and refresh the status bar
+    def _updateMetrics(self, cnf_table):
+        metrics.set("clauses", len(cnf_table))
+        metrics.set("literals", sum(len(t) for t in cnf_table))
+        self.app.updateStatusBar(metrics.summary())
 
     # 'parse' button handler
     # parse top input field to a CNF proposition object
@@ -17,22 +37,48 @@ class Controller:
         if input_str == "":
             self.app.showError(lang_error['input_empty'])
             return
-        # try to parse input to proposition
+        # try to parse input to a simplified CNF proposition
         try:
-            input_prop = decode_proposition_str(input_str)
+            cnf_prop = self._convertInput(input_str)
         except Exception as e:
             self.app.showError(e)
             return
         # update Model
-        # to CNF and simplify it
-        self.prop_history = [input_prop.to_cnf().simplify()]
+        self.prop_history = [cnf_prop]
+        self._startProof(cnf_prop)
         # UI update
         self.app.clearMiddle()
         self.app.updatePropositionView(self.prop_history[0])
+        if metrics.enabled:
+            self._updateMetrics(self.prop_history[0]._get_cnf_table())
+
+    # parse, to CNF and simplify, or load the result from the cache
+    def _convertInput(self, input_str):
+        if self.cache == None:
+            return decode_proposition_str(input_str).to_cnf().simplify()
+        with self.cache.get_or_convert(input_str) as db:
+            return db.to_proposition()
+
+    # a new proof for the session starting from prop
+    def _startProof(self, prop):
+        if self.proof != None:
+            self.proof.writer.close()
+        self.proof = None
+        if "LOGICVIEW_PROOF" in environ:
+            self.proof = DratLog(DratWriter(environ["LOGICVIEW_PROOF"]), prop.list_var_names())
+
+    # the proof is complete once the session reaches F
+    def _checkProofEnd(self, prop):
+        if self.proof != None and prop == F:
+            self.proof.writer.close()
+            self.proof = None
 
     # 'clear' button handler
     def clear(self):
         if len(self.prop_history) > 1:
+            # the logged clauses no longer match the history
+            if self.proof != None:
+                self.proof.available = False
             # update Model
             self.prop_history = self.prop_history[:-1]
             # UI update
@@ -45,50 +91,43 @@ class Controller:
         # get last proposition
         prop = self.prop_history[-1]
         # operation querried
-        operation = self.app.listOperations.currentText()
+        operation = self._operationKeys[self.app.listOperations.currentText()]
         # variable querried
         variable = Variable(self.app.listVariables.currentText())
-        # CNF table ands(ors)
-        cnf_table = prop._get_cnf_table()
-        # tautology operation
-        if operation == lang_operations['tautology']:
-            cnf_table = [k for k in cnf_table if not (variable in k and Not(variable) in k)]
-            prop = from_cnf_table(cnf_table).simplify()
-        # unit propagation operation
-        if operation == lang_operations['unitpropagation']:
-            var_prop, var_val = None, None
-            if [variable] in cnf_table:
-                var_prop, var_val = variable, T
-            elif [Not(variable)] in cnf_table:
-                var_prop, var_val = Not(variable), F
-            if var_prop != None:
-                cnf_table = [[p if p != var_prop else var_val for p in t] for t in cnf_table if t != [var_prop]]
-                prop = from_cnf_table(cnf_table).simplify()
-        # pur litteral elimination operation
-        if operation == lang_operations['purlitteralelimination']:
-            var_prop, var_val = None, None
-            if True in [variable in t for t in cnf_table] and not (True in [Not(variable) in t for t in cnf_table]):
-                var_prop, var_val = variable, T
-            elif not (True in [variable in t for t in cnf_table]) and True in [Not(variable) in t for t in cnf_table]:
-                var_prop, var_val = Not(variable), F
-            if var_prop != None:
-                cnf_table = [[p if p != var_prop else var_val for p in t] for t in cnf_table if t != [var_prop]]
-                prop = from_cnf_table(cnf_table).simplify()
-        # assign true operation
-        if operation == lang_operations['assigntrue']:
-            cnf_table = [t for t in cnf_table if not variable in t]
-            prop = from_cnf_table(cnf_table)
-        # assign false operation
-        if operation == lang_operations['assignfalse']:
-            cnf_table = [t for t in cnf_table if not Not(variable) in t]
-            prop = from_cnf_table(cnf_table)
+        with metrics.timer("apply " + operation):
+            prop = apply_operation(prop, operation, variable, self.proof)
+        # update Model
+        self.prop_history.append(prop)
+        self._checkProofEnd(prop)
+        # update UI
+        self.app.updatePropositionView(prop)
+        if metrics.enabled:
+            self._updateMetrics(prop._get_cnf_table())
+
+    # 'run script' button handler
+    # the whole script is run on the clause database, the view is updated once
+    def runScript(self):
+        script = self.app.scriptInput.text()
+        if script.strip() == "":
+            self.app.showError(lang_error['script_empty'])
+            return
+        try:
+            with metrics.timer("script"):
+                prop = run_script(self.prop_history[-1], script, self.proof)
+        except Exception as e:
+            self.app.showError(e)
+            return
         # update Model
         self.prop_history.append(prop)
+        self._checkProofEnd(prop)
         # update UI
         self.app.updatePropositionView(prop)
+        if metrics.enabled:
+            self._updateMetrics(prop._get_cnf_table())
 
     # bind event handlers to UI
     def bind(self):
         self.app.buttonParse.clicked.connect(self.parseInput)
         self.app.buttonReset.clicked.connect(self.clear)
         self.app.buttonApply.clicked.connect(self.apply)
+        self.app.buttonRun.clicked.connect(self.runScript)
@@ -11,10 +11,13 @@ lang_ui = {
     'error': "Error !",
     'parse': "Parse",
     'clear': "Clear",
-    'apply': "Apply"
+    'apply': "Apply",
+    'run': "Run script",
+    'script': "unitpropagation; purlitteralelimination; assign A=T"
 }
 
 lang_error = {
     'input_empty': "Type an expression to parse.\nExample : And(Or(Not(A), B))",
-    'history_empty': "Can't go further in the history..."
+    'history_empty': "Can't go further in the history...",
+    'script_empty': "Type a script to run.\nExample : unitpropagation; assign A=T"
 }
@@ -0,0 +1,391 @@
+#!/usr/bin/python3
+
+"""
+
+LogicView server :
+- newline delimited JSON requests over a Unix socket or TCP, with asyncio
+- operations : parse, to_cnf, check_theorem, solve, apply (Davis & Putnam step),
+  script (Davis & Putnam script)
+- worker processes keep warm sessions keyed by formula hash
+- small requests for the same worker are batched into one round-trip
+- backpressure (bounded in-flight requests per connection and bounded worker
+  queues) and deadlines, checked by the workers while they convert and solve
+
+Request : {"id": 1, "op": "solve", "formula": "And(A,Not(B))", "deadline": 2.5}
+Response : {"id": 1, "result": {...}} or {"id": 1, "error": "..."}
+
+Formulas are given in decode_proposition_str syntax, CNF results are lists
+of clauses of literal strings ("A", "-A"), and "apply" and "script" accept such
+"clauses" instead of a "formula".
+
+"""
+
+import asyncio
+import json
+import sys
+from argparse import ArgumentParser
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
+from time import time
+from logic.propositions import *
+from logic.solver import Solver, cnf_table_to_clauses, model_to_variables
+from logic.cache import input_key
+from logic.davisputnam import apply_operation, run_script
+
+
+# ---- worker side : sessions and operations
+
+MAX_SESSIONS = 256
+_sessions = OrderedDict()
+
+# parsed proposition, simplified CNF and integer clauses (of the formula and
+# of its negation) of a formula, kept warm in the worker
+def _session(formula):
+    key = input_key(formula)
+    session = _sessions.get(key)
+    if session == None:
+        prop = decode_proposition_str(formula)
+        session = {"prop": prop, "cnf": None, "clauses": None, "negated_clauses": None}
+        _sessions[key] = session
+        if len(_sessions) > MAX_SESSIONS:
+            _sessions.popitem(last=False)
+    else:
+        _sessions.move_to_end(key)
+    return session
+
+# stream items, raising once the request expired, the CNF of a formula can
+# be exponentially larger than the formula
+def _until(items, expires):
+    for k, item in enumerate(items):
+        if k & 1023 == 0 and time() > expires:
+            raise Exception("deadline exceeded")
+        yield item
+
+def _session_cnf(session, expires=float("inf")):
+    if session["cnf"] == None:
+        cnf_table = list(_until(session["prop"].iter_cnf(), expires))
+        session["cnf"] = from_cnf_table(cnf_table).simplify()
+    return session["cnf"]
+
+# (variable names, clauses) of the formula, or of its negation
+def _session_clauses(session, negated=False, expires=float("inf")):
+    key = "negated_clauses" if negated else "clauses"
+    if session[key] == None:
+        prop = Not(session["prop"]) if negated else session["prop"]
+        session[key] = cnf_table_to_clauses(_until(prop.iter_cnf(tautologies=False), expires),
+                                            prop.list_var_names())
+    return session[key]
+
+# the Solver copies the clauses, so the session ones can be solved again
+def _solve_clauses(var_names, clauses, expires=float("inf")):
+    solver = Solver(len(var_names), clauses,
+                    deadline=expires if expires != float("inf") else None)
+    if solver.solve():
+        return model_to_variables(var_names, solver.model())
+    return None
+
+def _table_to_json(prop):
+    return [sorted(str(p) for p in t) for t in prop._get_cnf_table()]
+
+def _literal_from_json(literal):
+    if literal == "T":
+        return T
+    if literal == "F":
+        return F
+    if literal.startswith("-"):
+        return Not(Variable(literal[1:]))
+    return Variable(literal)
+
+def _prop_from_json(clauses):
+    return from_cnf_table([[_literal_from_json(l) for l in c] for c in clauses])
+
+def _op_parse(request):
+    prop = _session(request["formula"])["prop"]
+    return {"proposition": str(prop), "variables": prop.list_var_names()}
+
+# requests carry the time() they expire at, see Server.submit
+def _expires(request):
+    return request.get("expires", float("inf"))
+
+def _op_to_cnf(request):
+    return {"clauses": _table_to_json(_session_cnf(_session(request["formula"]),
+                                                   _expires(request)))}
+
+def _op_check_theorem(request):
+    # a counter example is a model of the negation
+    session = _session(request["formula"])
+    counter_example = _solve_clauses(*_session_clauses(session, True, _expires(request)),
+                                     _expires(request))
+    return {"theorem": counter_example == None, "counter_example": counter_example}
+
+def _op_solve(request):
+    session = _session(request["formula"])
+    model = _solve_clauses(*_session_clauses(session, False, _expires(request)),
+                           _expires(request))
+    return {"satisfiable": model != None, "model": model}
+
+def _op_apply(request):
+    if "clauses" in request:
+        prop = _prop_from_json(request["clauses"])
+    else:
+        prop = _session_cnf(_session(request["formula"]), _expires(request))
+    prop = apply_operation(prop, request["operation"], Variable(request["variable"]))
+    return {"clauses": _table_to_json(prop)}
+
+def _op_script(request):
+    if "clauses" in request:
+        prop = _prop_from_json(request["clauses"])
+    else:
+        prop = _session_cnf(_session(request["formula"]), _expires(request))
+    return {"clauses": _table_to_json(run_script(prop, request["script"]))}
+
+_ops = {
+    "parse": _op_parse,
+    "to_cnf": _op_to_cnf,
+    "check_theorem": _op_check_theorem,
+    "solve": _op_solve,
+    "apply": _op_apply,
+    "script": _op_script
+}
+
+def handle_request(request):
+    op = request.get("op")
+    if not op in _ops:
+        raise Exception("Unknown operation: {}".format(op))
+    return _ops[op](request)
+
+# run several requests in one worker round-trip, expired requests are skipped
+def run_batch(requests):
+    responses = []
+    for request in requests:
+        response = {"id": request.get("id")}
+        if _expires(request) < time():
+            response["error"] = "deadline exceeded"
+        else:
+            try:
+                response["result"] = handle_request(request)
+            except Exception as e:
+                response["error"] = str(e)
+        responses.append(response)
+    return responses
+
+
+# ---- server side
+
+class Server:
+    """Asyncio front end dispatching requests to worker processes
+
+    Parameters
+    ----------
+    workers : int
+        number of worker processes, default is the number of CPU cores
+    max_batch : int
+        maximum number of requests sent to a worker in one round-trip
+    batch_window : float
+        seconds to wait for more requests before sending a partial batch
+    max_pending : int
+        in-flight requests per connection, reading stops above it
+    max_queued : int
+        requests waiting for each worker, submitting waits above it so that
+        all connections are pushed back
+    default_deadline : float
+        seconds allowed to a request without its own "deadline"
+    """
+
+    def __init__(self, workers=None, max_batch=32, batch_window=0.001,
+                 max_pending=64, max_queued=256, default_deadline=30.0):
+        self.n_workers = workers or cpu_count()
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.max_pending = max_pending
+        self.max_queued = max_queued
+        self.default_deadline = default_deadline
+        self.servers = []
+        # connection handler task by stream writer
+        self.connections = {}
+
+    async def start(self, path=None, host="127.0.0.1", port=0):
+        # one single process executor per worker so that sessions stay warm
+        self.executors = [ProcessPoolExecutor(1) for _ in range(self.n_workers)]
+        self.queues = [asyncio.Queue(self.max_queued) for _ in range(self.n_workers)]
+        self.batchers = [asyncio.ensure_future(self._batcher(i))
+                         for i in range(self.n_workers)]
+        if path != None:
+            server = await asyncio.start_unix_server(self._handle_connection, path)
+        else:
+            server = await asyncio.start_server(self._handle_connection, host, port)
+        self.servers.append(server)
+        return server
+
+    async def close(self):
+        for server in self.servers:
+            server.close()
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*self.connections.values(), return_exceptions=True)
+        for server in self.servers:
+            await server.wait_closed()
+        for batcher in self.batchers:
+            batcher.cancel()
+        for executor in self.executors:
+            executor.shutdown()
+
+    async def submit(self, request):
+        """Queue a request on its worker and wait for its response"""
+        deadline = request.get("deadline", self.default_deadline)
+        if isinstance(deadline, bool) or not isinstance(deadline, (int, float)):
+            return {"id": request.get("id"), "error": "Invalid deadline: {}".format(deadline)}
+        request = dict(request, expires=time() + deadline)
+        # same formula, same worker, same warm session
+        key = request.get("formula") or json.dumps(request.get("clauses"))
+        worker = int(input_key(str(key))[:8], 16) % self.n_workers
+        # waiting for room in a full queue counts toward the deadline
+        try:
+            return await asyncio.wait_for(self._dispatch(worker, request), deadline)
+        except asyncio.TimeoutError:
+            return {"id": request.get("id"), "error": "deadline exceeded"}
+
+    async def _dispatch(self, worker, request):
+        future = asyncio.get_running_loop().create_future()
+        await self.queues[worker].put((request, future))
+        return await future
+
+    async def _batcher(self, worker):
+        loop = asyncio.get_running_loop()
+        queue = self.queues[worker]
+        while True:
+            batch = [await queue.get()]
+            # gather what arrives within the batch window
+            if queue.empty() and self.batch_window > 0:
+                await asyncio.sleep(self.batch_window)
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            # requests whose caller gave up are not sent
+            batch = [(r, f) for (r, f) in batch if not f.done()]
+            if not batch:
+                continue
+            try:
+                responses = await loop.run_in_executor(self.executors[worker], run_batch,
+                                                       [r for (r, f) in batch])
+            except Exception as e:
+                responses = [{"id": r.get("id"), "error": str(e)} for (r, f) in batch]
+            for (r, f), response in zip(batch, responses):
+                if not f.done():
+                    f.set_result(response)
+
+    async def _handle_connection(self, reader, writer):
+        self.connections[writer] = asyncio.current_task()
+        pending = asyncio.Semaphore(self.max_pending)
+        tasks = set()
+        async def respond(line):
+            try:
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                except ValueError as e:
+                    response = {"id": None, "error": "Invalid request: {}".format(e)}
+                else:
+                    # an error line is always sent, the client would wait forever
+                    try:
+                        response = await self.submit(request)
+                    except Exception as e:
+                        response = {"id": request.get("id"), "error": str(e)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+            finally:
+                pending.release()
+        try:
+            while True:
+                # backpressure : stop reading while too many requests are in flight
+                await pending.acquire()
+                line = await reader.readline()
+                if not line:
+                    pending.release()
+                    break
+                task = asyncio.ensure_future(respond(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+
+
+# ---- clients
+
+class Client:
+    """Asyncio client, requests may be sent concurrently"""
+
+    async def connect(self, path=None, host="127.0.0.1", port=None):
+        if path != None:
+            self.reader, self.writer = await asyncio.open_unix_connection(path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.next_id = 0
+        self.pending = {}
+        self.receiver = asyncio.ensure_future(self._receive())
+        return self
+
+    async def _receive(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self.pending.pop(response.get("id"), None)
+            if future != None and not future.done():
+                future.set_result(response)
+        for future in self.pending.values():
+            future.set_exception(ConnectionError("connection closed"))
+
+    async def request(self, op, **params):
+        """Send a request, returns its result or raises its error"""
+        self.next_id += 1
+        request = dict(params, op=op, id=self.next_id)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self.next_id] = future
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        await self.writer.drain()
+        return _result(await future)
+
+    async def close(self):
+        self.writer.close()
+        self.receiver.cancel()
+
+
+class LocalClient:
+    """In process stand-in for Client, no socket and no worker process"""
+
+    async def request(self, op, **params):
+        return _result(run_batch([dict(params, op=op)])[0])
+
+    async def close(self):
+        pass
+
+
+def _result(response):
+    if "error" in response:
+        raise Exception(response["error"])
+    return response["result"]
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="LogicView server")
+    parser.add_argument("--unix", help="Unix socket path")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    async def main():
+        server = Server(workers=args.workers)
+        await server.start(args.unix, args.host, args.port)
+        await asyncio.Event().wait()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        sys.exit(0)
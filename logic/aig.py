@@ -0,0 +1,639 @@
+#!/usr/bin/python3
+
+"""
+
+And-inverter graph module :
+- propositions (Not, And, Or, Implies, Equivalent) lowered to a shared graph
+  of two input AND nodes and complemented edges
+- structural hashing and local rewriting rules on every new node
+- cut-based rewriting : small cones resynthesized from their truth tables
+- balancing of AND chains, fraig-style merging of equivalent nodes
+  (random simulation signatures, then SAT checks with the Solver)
+- Tseitin CNF emission, evaluation and bit vector simulation
+
+Literal l is node l >> 1, complemented if l & 1, node 0 is the constant
+false : literal 0 is false and literal 1 is true.
+
+"""
+
+import heapq
+from random import Random
+try:
+    from .propositions import *
+    from .solver import Solver, model_to_variables
+    from .metrics import metrics
+except ImportError:
+    from propositions import *
+    from solver import Solver, model_to_variables
+    from metrics import metrics
+
+
+FALSE, TRUE = 0, 1
+
+
+# truth table of variable i of k, minterm m is bit m
+def _var_table(i, k):
+    return sum(1 << m for m in range(1 << k) if m >> i & 1)
+
+# cofactors (x_i = 0, x_i = 1) of a truth table of k variables, as tables of k variables
+def _cofactors(table, i, k):
+    t0, t1 = 0, 0
+    for m in range(1 << k):
+        t0 |= (table >> (m & ~(1 << i)) & 1) << m
+        t1 |= (table >> (m | 1 << i) & 1) << m
+    return t0, t1
+
+# truth table over leaves of a function given over sub_leaves (a subset)
+def _expand_table(table, sub_leaves, leaves):
+    positions = [leaves.index(l) for l in sub_leaves]
+    result = 0
+    for m in range(1 << len(leaves)):
+        sub_m = sum((m >> p & 1) << j for j, p in enumerate(positions))
+        result |= (table >> sub_m & 1) << m
+    return result
+
+
+def negate(lit):
+    return lit ^ 1
+
+def node(lit):
+    return lit >> 1
+
+def is_complemented(lit):
+    return lit & 1 == 1
+
+
+class AIG:
+    """And-inverter graph, nodes are created in topological order
+
+    Inputs are named, outputs are literals, see proposition_to_aig.
+    """
+
+    def __init__(self):
+        # fanin literals by node, None for the constant and the inputs
+        self.fanins = [None]
+        self.levels = [0]
+        self.inputs = []
+        self.input_nodes = {}
+        self.input_names = {}
+        self.outputs = []
+        # structural hashing : (fanin, fanin) -> node
+        self.strash = {}
+
+    def __len__(self):
+        return len(self.fanins)
+
+    def n_ands(self):
+        return len(self.fanins) - 1 - len(self.inputs)
+
+    def is_and(self, n):
+        return self.fanins[n] != None
+
+    def input(self, name):
+        if name in self.input_nodes:
+            return 2 * self.input_nodes[name]
+        n = len(self.fanins)
+        self.fanins.append(None)
+        self.levels.append(0)
+        self.inputs.append(name)
+        self.input_nodes[name] = n
+        self.input_names[n] = name
+        return 2 * n
+
+    def list_var_names(self):
+        return sorted(self.inputs)
+
+    # fanins of a literal if it is a non complemented AND, None otherwise
+    def _and_fanins(self, lit):
+        if is_complemented(lit):
+            return None
+        return self.fanins[node(lit)]
+
+    # fanins of a literal if it is a complemented AND, None otherwise
+    def _nand_fanins(self, lit):
+        if not is_complemented(lit):
+            return None
+        return self.fanins[node(lit)]
+
+    def and_(self, a, b):
+        """AND of two literals, after constant folding, local rewriting
+        and structural hashing"""
+        if a > b:
+            a, b = b, a
+        # constants and trivial cases
+        if a == FALSE or a == negate(b):
+            return FALSE
+        if a == TRUE or a == b:
+            return b
+        # two level rules, with x = a or b and y the other one
+        for x, y in [(a, b), (b, a)]:
+            fx = self._and_fanins(x)
+            if fx != None:
+                # contradiction : (p & q) & -p = 0
+                if negate(y) in fx:
+                    return FALSE
+                # idempotence : (p & q) & p = p & q
+                if y in fx:
+                    return x
+                fy = self._and_fanins(y)
+                # contradiction : (p & q) & (-p & r) = 0
+                if fy != None and any(negate(p) in fy for p in fx):
+                    return FALSE
+            fx = self._nand_fanins(x)
+            if fx != None:
+                # subsumption : -(p & q) & -p = -p
+                if negate(y) in fx:
+                    return y
+                # substitution : -(p & q) & p = p & -q
+                if y in fx:
+                    other = fx[1] if fx[0] == y else fx[0]
+                    return self.and_(y, negate(other))
+                fy = self._nand_fanins(y)
+                # resolution : -(p & q) & -(p & -q) = -p
+                if fy != None:
+                    for p in fx:
+                        q = fx[1] if fx[0] == p else fx[0]
+                        if p in fy and negate(q) in fy:
+                            return negate(p)
+        key = (a, b)
+        n = self.strash.get(key)
+        if n == None:
+            n = len(self.fanins)
+            self.fanins.append(key)
+            self.levels.append(1 + max(self.levels[node(a)], self.levels[node(b)]))
+            self.strash[key] = n
+        return 2 * n
+
+    def or_(self, a, b):
+        return negate(self.and_(negate(a), negate(b)))
+
+    def implies(self, a, b):
+        return negate(self.and_(a, negate(b)))
+
+    def xor(self, a, b):
+        return self.and_(negate(self.and_(a, b)), negate(self.and_(negate(a), negate(b))))
+
+    def equivalent(self, a, b):
+        return negate(self.xor(a, b))
+
+    def add_proposition(self, prop):
+        """Lower a proposition, returns its literal"""
+        # sub propositions shared in the tree are lowered once
+        memo = {}
+        def lower(p):
+            if id(p) in memo:
+                return memo[id(p)]
+            if p.__class__ == Value:
+                lit = TRUE if p.value else FALSE
+            elif p.__class__ == Variable:
+                lit = self.input(str(p))
+            elif p.__class__ == Not:
+                lit = negate(lower(p.arg1))
+            elif p.__class__ == And:
+                lit = self.and_(lower(p.arg1), lower(p.arg2))
+            elif p.__class__ == Or:
+                lit = self.or_(lower(p.arg1), lower(p.arg2))
+            elif p.__class__ == Implies:
+                lit = self.implies(lower(p.arg1), lower(p.arg2))
+            elif p.__class__ == Equivalent:
+                lit = self.equivalent(lower(p.arg1), lower(p.arg2))
+            else:
+                raise Exception("No AIG lowering defined for class {}"
+                                .format(p.__class__.__name__))
+            memo[id(p)] = lit
+            return lit
+        return lower(prop)
+
+    # the given literal, or the only output
+    def output(self, lit=None):
+        if lit != None:
+            return lit
+        if len(self.outputs) != 1:
+            raise Exception("Expected a literal for {} outputs".format(len(self.outputs)))
+        return self.outputs[0]
+
+    # nodes in the cones of the literals, in topological order
+    def cone(self, lits):
+        seen = set()
+        stack = [node(l) for l in lits]
+        while stack:
+            n = stack.pop()
+            if n in seen:
+                continue
+            seen.add(n)
+            if self.is_and(n):
+                stack.extend(node(l) for l in self.fanins[n])
+        return sorted(seen)
+
+    def depth(self, lit=None):
+        return self.levels[node(self.output(lit))]
+
+    # ---- evaluation
+
+    # values of the nodes as bit vectors
+    def _simulate(self, nodes, columns, ones):
+        values = {0: ones ^ ones}
+        for n in nodes:
+            if self.is_and(n):
+                a, b = self.fanins[n]
+                va, vb = values[node(a)], values[node(b)]
+                values[n] = (ones ^ va if a & 1 else va) & (ones ^ vb if b & 1 else vb)
+            elif n != 0:
+                name = self.input_names[n]
+                if not name in columns:
+                    raise Exception("Variable value not defined : {}".format(name))
+                values[n] = columns[name]
+        return values
+
+    def evaluate_vector(self, columns, ones, lit=None):
+        """Evaluate a literal (the output by default) on many inputs at once,
+        see Proposition.evaluate_vector"""
+        lit = self.output(lit)
+        value = self._simulate(self.cone([lit]), columns, ones)[node(lit)]
+        return ones ^ value if is_complemented(lit) else value
+
+    def evaluate(self, variables, lit=None):
+        """Evaluate a literal (the output by default), see Proposition.evaluate"""
+        columns = dict((name, 1 if value else 0) for name, value in variables.items())
+        return self.evaluate_vector(columns, 1, lit) == 1
+
+    # ---- CNF
+
+    # fanout counts in the cones of the literals, the literals count as fanouts
+    def _fanouts(self, lits):
+        fanouts = [0] * len(self.fanins)
+        for n in self.cone(lits):
+            if self.is_and(n):
+                for l in self.fanins[n]:
+                    fanouts[node(l)] += 1
+        for l in lits:
+            fanouts[node(l)] += 1
+        return fanouts
+
+    # leaves of the AND supergate rooted at node n : non complemented AND
+    # fanins used only once are expanded
+    def _leaves(self, n, fanouts):
+        leaves = []
+        stack = list(self.fanins[n])
+        while stack:
+            l = stack.pop()
+            if not is_complemented(l) and self.is_and(node(l)) and fanouts[node(l)] == 1:
+                stack.extend(self.fanins[node(l)])
+            else:
+                leaves.append(l)
+        return leaves
+
+    # supergate roots in the cone of the literals, in topological order
+    def _roots(self, lits, fanouts):
+        roots = []
+        stack = [node(l) for l in lits if self.is_and(node(l))]
+        seen = set(stack)
+        while stack:
+            n = stack.pop()
+            roots.append(n)
+            for l in self._leaves(n, fanouts):
+                if self.is_and(node(l)) and not node(l) in seen:
+                    seen.add(node(l))
+                    stack.append(node(l))
+        return sorted(roots)
+
+    # Tseitin clauses of the AND nodes, var maps nodes to variables
+    def _tseitin(self, nodes, var):
+        def lit(l):
+            return -var[node(l)] if is_complemented(l) else var[node(l)]
+        clauses = []
+        for n in nodes:
+            if self.is_and(n):
+                a, b = self.fanins[n]
+                clauses.append([-var[n], lit(a)])
+                clauses.append([-var[n], lit(b)])
+                clauses.append([var[n], -lit(a), -lit(b)])
+        return clauses
+
+    def to_clauses(self, lit=None):
+        """Tseitin CNF asserting a literal (the output by default)
+
+        A multi input AND (supergate) gets one variable and k + 1 clauses
+        instead of k - 1 variables and 3 (k - 1) clauses.
+        Variable i is the i-th name of list_var_names(), auxiliary variables
+        follow.
+        Returns (number of variables, clauses)
+        """
+        lit = self.output(lit)
+        var_names = self.list_var_names()
+        if lit == FALSE:
+            return len(var_names), [[]]
+        if lit == TRUE:
+            return len(var_names), []
+        var = dict((self.input_nodes[name], i+1) for i, name in enumerate(var_names))
+        fanouts = self._fanouts([lit])
+        roots = self._roots([lit], fanouts)
+        for n in roots:
+            var[n] = len(var) + 1
+        def literal(l):
+            return -var[node(l)] if is_complemented(l) else var[node(l)]
+        clauses = []
+        for n in roots:
+            leaves = [literal(l) for l in self._leaves(n, fanouts)]
+            clauses.extend([-var[n], l] for l in leaves)
+            clauses.append([var[n]] + [-l for l in leaves])
+        clauses.append([literal(lit)])
+        return len(var), clauses
+
+    # ---- transformations, they return a new AIG with the same inputs
+
+    # copy of the output cones, build(new, n, lits) returns the new literal
+    # of AND node n, lits being the new literals of the nodes built so far
+    # nodes : the nodes to build in topological order, default is the cones
+    def _rebuild(self, build=None, nodes=None):
+        new = AIG()
+        lits = {0: FALSE}
+        for name in self.inputs:
+            lits[self.input_nodes[name]] = new.input(name)
+        for n in nodes if nodes != None else self.cone(self.outputs):
+            if not self.is_and(n):
+                continue
+            if build != None:
+                lits[n] = build(new, n, lits)
+            else:
+                a, b = self.fanins[n]
+                lits[n] = new.and_(lits[node(a)] ^ (a & 1), lits[node(b)] ^ (b & 1))
+        new.outputs = [lits[node(l)] ^ (l & 1) for l in self.outputs]
+        return new
+
+    def cleanup(self):
+        """Copy without the nodes outside of the output cones"""
+        return self._rebuild()
+
+    # drop the nodes from size on, to undo a trial synthesis
+    def _truncate(self, size):
+        for n in range(size, len(self.fanins)):
+            del self.strash[self.fanins[n]]
+        del self.fanins[size:]
+        del self.levels[size:]
+
+    def _synthesize(self, table, lits):
+        """Literal of a truth table over the given literals, by Shannon
+        decomposition on the variable with the simplest cofactors"""
+        k = len(lits)
+        full = (1 << (1 << k)) - 1
+        if table == 0:
+            return FALSE
+        if table == full:
+            return TRUE
+        cofactors = [_cofactors(table, i, k) for i in range(k)]
+        support = [i for i in range(k) if cofactors[i][0] != cofactors[i][1]]
+        for i in support:
+            if table == _var_table(i, k):
+                return lits[i]
+            if table == full ^ _var_table(i, k):
+                return negate(lits[i])
+        def score(i):
+            t0, t1 = cofactors[i]
+            if t0 in [0, full] or t1 in [0, full]:
+                return 0
+            return 1 if t0 == full ^ t1 else 2
+        i = min(support, key=score)
+        x, (t0, t1) = lits[i], cofactors[i]
+        if t0 == 0:
+            return self.and_(x, self._synthesize(t1, lits))
+        if t1 == 0:
+            return self.and_(negate(x), self._synthesize(t0, lits))
+        if t0 == full:
+            return self.or_(negate(x), self._synthesize(t1, lits))
+        if t1 == full:
+            return self.or_(x, self._synthesize(t0, lits))
+        if t1 == full ^ t0:
+            return self.xor(x, self._synthesize(t0, lits))
+        return self.or_(self.and_(x, self._synthesize(t1, lits)),
+                        self.and_(negate(x), self._synthesize(t0, lits)))
+
+    # cuts of at most cut_size leaves of the nodes in the output cones, as
+    # (leaf nodes, truth table over the leaves), the trivial cut comes first
+    def _cuts(self, cut_size, max_cuts):
+        cuts = {}
+        for n in self.cone(self.outputs):
+            if not self.is_and(n):
+                cuts[n] = [((n,), 2)] if n != 0 else []
+                continue
+            a, b = self.fanins[n]
+            found = {}
+            for leaves_a, table_a in cuts[node(a)]:
+                for leaves_b, table_b in cuts[node(b)]:
+                    leaves = tuple(sorted(set(leaves_a) | set(leaves_b)))
+                    if len(leaves) > cut_size or leaves in found:
+                        continue
+                    full = (1 << (1 << len(leaves))) - 1
+                    ta = _expand_table(table_a, leaves_a, leaves)
+                    tb = _expand_table(table_b, leaves_b, leaves)
+                    found[leaves] = (full ^ ta if a & 1 else ta) & (full ^ tb if b & 1 else tb)
+            # smallest cuts first
+            found = sorted(found.items(), key=lambda cut: len(cut[0]))[:max_cuts]
+            cuts[n] = [((n,), 2)] + found
+        return cuts
+
+    # nodes that would be dead without n, n included, down to the leaves
+    # (maximum fanout free cone)
+    def _mffc(self, n, leaves, fanouts):
+        refs = {}
+        mffc = []
+        stack = [n]
+        while stack:
+            m = stack.pop()
+            mffc.append(m)
+            for l in self.fanins[m]:
+                f = node(l)
+                if f in leaves or not self.is_and(f):
+                    continue
+                refs[f] = refs.get(f, fanouts[f]) - 1
+                if refs[f] == 0:
+                    stack.append(f)
+        return mffc
+
+    # nodes of the cone of lit down to the stop nodes
+    def _cone_until(self, lit, stop):
+        seen = set()
+        stack = [node(lit)]
+        while stack:
+            n = stack.pop()
+            if n in seen or n in stop:
+                continue
+            seen.add(n)
+            if self.is_and(n):
+                stack.extend(node(l) for l in self.fanins[n])
+        return seen
+
+    def rewrite(self, cut_size=4, max_cuts=8):
+        """Copy with small cones replaced by cheaper structures
+
+        For every node, each cut of at most cut_size leaves is resynthesized
+        from its truth table over the already built leaves. The cheapest
+        structure is kept when it adds fewer nodes than it frees : the node
+        and the nodes only it uses, unless the new structure reuses them
+        (structural hashing makes existing nodes free).
+        """
+        fanouts = self._fanouts(self.outputs)
+        cuts = self._cuts(cut_size, max_cuts)
+        def build(new, n, lits):
+            best, best_gain = None, 0
+            for leaves, table in cuts[n][1:]:
+                leaf_lits = [lits[l] for l in leaves]
+                size = len(new)
+                lit = new._synthesize(table, leaf_lits)
+                added = len(new) - size
+                used = new._cone_until(lit, set(node(l) for l in leaf_lits))
+                new._truncate(size)
+                # n itself, and the already built nodes only n uses
+                saved = 1 + sum(1 for m in self._mffc(n, set(leaves), fanouts)[1:]
+                                if not node(lits[m]) in used)
+                if saved - added > best_gain:
+                    best, best_gain = (leaves, table), saved - added
+            if best != None:
+                leaves, table = best
+                return new._synthesize(table, [lits[l] for l in leaves])
+            a, b = self.fanins[n]
+            return new.and_(lits[node(a)] ^ (a & 1), lits[node(b)] ^ (b & 1))
+        rewritten = self._rebuild(build).cleanup()
+        # gains are estimated, a rewriting never makes the graph bigger
+        copy = self.cleanup()
+        return rewritten if rewritten.n_ands() <= copy.n_ands() else copy
+
+    def balance(self):
+        """Copy with AND chains rebuilt as trees of minimum depth"""
+        fanouts = self._fanouts(self.outputs)
+        def build(new, n, lits):
+            heap = []
+            for i, l in enumerate(self._leaves(n, fanouts)):
+                lit = lits[node(l)] ^ (l & 1)
+                heap.append((new.levels[node(lit)], i, lit))
+            heapq.heapify(heap)
+            # the two shallowest leaves first
+            i = len(heap)
+            while len(heap) > 1:
+                a = heapq.heappop(heap)[2]
+                b = heapq.heappop(heap)[2]
+                lit = new.and_(a, b)
+                heapq.heappush(heap, (new.levels[node(lit)], i, lit))
+                i += 1
+            return heap[0][2]
+        # only the supergate roots are built, their leaves are roots or inputs
+        return self._rebuild(build, self._roots(self.outputs, fanouts)).cleanup()
+
+    def fraig(self, n_patterns=64, seed=None, **options):
+        """Copy with functionally equivalent nodes merged
+
+        Nodes are grouped by random simulation signatures (up to
+        complementation), then each candidate pair is proven equivalent
+        with the Solver on the Tseitin CNF of the graph, a counter example
+        being added to the simulation patterns.
+
+        Parameters
+        ----------
+        n_patterns : int
+            number of random input patterns
+        seed : int
+        options : dict
+            Solver options
+        """
+        random = Random(seed)
+        nodes = self.cone(self.outputs)
+        # Tseitin variables, the constant node has none
+        var = dict((n, i+1) for i, n in enumerate(n for n in nodes if n != 0))
+        solver = Solver(len(var), self._tseitin(nodes, var), **options)
+        def solver_lit(n, complemented):
+            return -var[n] if complemented else var[n]
+        columns = dict((name, random.getrandbits(n_patterns)) for name in self.inputs)
+        ones = (1 << n_patterns) - 1
+        values = self._simulate(nodes, columns, ones)
+        # signature up to complementation : bit 0 is cleared
+        def signature(n):
+            v = values[n]
+            return (v ^ ones, True) if v & 1 else (v, False)
+        representatives = [n for n in nodes if not self.is_and(n)]
+        classes = {}
+        for m in representatives:
+            classes.setdefault(signature(m)[0], []).append(m)
+        # n is equivalent to m (complemented), or a counter example model
+        def check(m, n, complemented):
+            if m == 0:
+                checks = [[solver_lit(n, complemented)]]
+            else:
+                checks = [[var[m], solver_lit(n, not complemented)],
+                          [-var[m], solver_lit(n, complemented)]]
+            for assumptions in checks:
+                if solver.solve(assumptions):
+                    return solver.model()
+            return None
+        merged = {}
+        n_checks = 0
+        for n in nodes:
+            if not self.is_and(n):
+                continue
+            while True:
+                key, phase = signature(n)
+                if not key in classes:
+                    break
+                m = classes[key][0]
+                complemented = phase != signature(m)[1]
+                n_checks += 1
+                model = check(m, n, complemented)
+                if model == None:
+                    merged[n] = (m, complemented)
+                    break
+                # the counter example is one more pattern, it separates n and m
+                for name in self.inputs:
+                    i = self.input_nodes[name]
+                    bit = model[var[i]-1] > 0 if i in var else random.random() < 0.5
+                    columns[name] = columns[name] << 1 | bit
+                ones = ones << 1 | 1
+                values = self._simulate(nodes, columns, ones)
+                classes = {}
+                for r in representatives:
+                    classes.setdefault(signature(r)[0], []).append(r)
+            if n in merged:
+                m, complemented = merged[n]
+                # the equivalence helps later checks
+                if m == 0:
+                    solver.add_clause([solver_lit(n, not complemented)])
+                else:
+                    solver.add_clause([-var[n], solver_lit(m, complemented)])
+                    solver.add_clause([var[n], solver_lit(m, not complemented)])
+            else:
+                representatives.append(n)
+                classes.setdefault(signature(n)[0], []).append(n)
+        metrics.count("fraig_checks", n_checks)
+        metrics.count("fraig_merges", len(merged))
+        def build(new, n, lits):
+            if n in merged:
+                m, complemented = merged[n]
+                return lits[m] ^ (1 if complemented else 0)
+            a, b = self.fanins[n]
+            return new.and_(lits[node(a)] ^ (a & 1), lits[node(b)] ^ (b & 1))
+        return self._rebuild(build).cleanup()
+
+
+# AIG with one output, the literal of prop
+def proposition_to_aig(prop):
+    aig = AIG()
+    aig.outputs.append(aig.add_proposition(prop))
+    return aig
+
+
+# balance, rewrite and fraig passes
+def optimize(aig, fraig=True, seed=None):
+    aig = aig.balance().rewrite()
+    if fraig:
+        aig = aig.fraig(seed=seed).balance()
+    return aig
+
+
+# solve a proposition through its optimized AIG and supergate Tseitin CNF
+# returns a {name: bool} satisfying dict or None
+def solve_with_aig(prop, fraig=False, **options):
+    aig = optimize(proposition_to_aig(prop), fraig)
+    var_names = aig.list_var_names()
+    n_vars, clauses = aig.to_clauses()
+    solver = Solver(n_vars, clauses, **options)
+    if solver.solve():
+        return model_to_variables(var_names, solver.model()[:len(var_names)])
+    return None
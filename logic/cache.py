@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+
+"""
+
+Cache module :
+- content addressed on-disk cache of CNF converted propositions
+- keys are hashes of the normalized input string
+- compact binary clause database, memory-mapped on load
+- LRU eviction by total size, format versioning
+
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+from re import sub
+try:
+    from .solver import *
+except ImportError:
+    from solver import *
+
+
+# bump when the file layout or the conversion pipeline changes
+# 2 : streamed CNF conversion, negations pushed down correctly
+FORMAT_VERSION = 2
+MAGIC = b"LVCNF\0\0\0"
+# magic, version, n_vars, n_clauses, n_literals, names size
+HEADER = struct.Struct("<8sIIQQQ")
+EXTENSION = ".cnf"
+
+
+# same input as decode_proposition_str would see, with aliases resolved
+def normalize_input(theorem_str):
+    theorem_str = theorem_str.replace(" ", "").replace("\n", "")
+    if ':' in theorem_str:
+        theorem_str = theorem_str.split(":")[1]
+    theorem_str = sub(r"\bImply\(", "Implies(", theorem_str)
+    theorem_str = sub(r"\bEquiv\(", "Equivalent(", theorem_str)
+    return theorem_str
+
+
+def input_key(theorem_str):
+    h = hashlib.sha256()
+    h.update("{}:{}:".format(FORMAT_VERSION, sys.byteorder).encode())
+    h.update(normalize_input(theorem_str).encode())
+    return h.hexdigest()
+
+
+def _padding(n):
+    return -n % 8
+
+
+# write clauses in the cache binary layout
+# header, variable names ('\n' separated, padded to 8 bytes),
+# clause offsets (int64, n_clauses+1), literals (int32)
+def write_clause_database(path, var_names, clauses):
+    names = "\n".join(var_names).encode()
+    offsets = array("q", [0])
+    literals = array("i")
+    for c in clauses:
+        literals.extend(c)
+        offsets.append(len(literals))
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(var_names),
+                            len(offsets) - 1, len(literals), len(names)))
+        f.write(names + b"\0" * _padding(len(names)))
+        f.write(offsets.tobytes())
+        f.write(literals.tobytes())
+
+
+class ClauseDatabase:
+    """Memory-mapped clause database, as written by write_clause_database
+
+    Clauses are only decoded when accessed, db[i] is the i-th clause.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise Exception("Truncated clause database: {}".format(path))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = HEADER.unpack_from(self._mmap)
+            magic, version, n_vars, n_clauses, n_literals, names_size = header
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise Exception("Unsupported clause database: {}".format(path))
+            start = HEADER.size
+            names_end = start + names_size
+            offsets_start = names_end + _padding(names_size)
+            literals_start = offsets_start + 8 * (n_clauses + 1)
+            if literals_start + 4 * n_literals != size:
+                raise Exception("Truncated clause database: {}".format(path))
+            names = self._mmap[start:names_end].decode()
+            self.var_names = names.split("\n") if n_vars > 0 else []
+            view = memoryview(self._mmap)
+            self._offsets = view[offsets_start:literals_start].cast("q")
+            self._literals = view[literals_start:].cast("i")
+            view.release()
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return self._literals[self._offsets[i]:self._offsets[i+1]].tolist()
+
+    def __iter__(self):
+        literals = self._literals.tolist()
+        offsets = self._offsets.tolist()
+        for i in range(len(offsets) - 1):
+            yield literals[offsets[i]:offsets[i+1]]
+
+    def clauses(self):
+        return list(self)
+
+    def to_proposition(self):
+        return from_cnf_table(clauses_to_cnf_table(self.var_names, self))
+
+    def close(self):
+        for view in ("_offsets", "_literals"):
+            if hasattr(self, view):
+                getattr(self, view).release()
+                delattr(self, view)
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CnfCache:
+    """On-disk cache of CNF conversions keyed by input content
+
+    Parameters
+    ----------
+    directory : str
+        cache directory, created if needed
+    max_bytes : int
+        least recently used entries are evicted above this total size
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, theorem_str):
+        return os.path.join(self.directory, input_key(theorem_str) + EXTENSION)
+
+    # returns a ClauseDatabase or None
+    def get(self, theorem_str):
+        path = self.path(theorem_str)
+        try:
+            db = ClauseDatabase(path)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # stale or corrupted entry
+            os.remove(path)
+            return None
+        # access time is the LRU order
+        os.utime(path)
+        return db
+
+    def put(self, theorem_str, var_names, clauses):
+        path = self.path(theorem_str)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        write_clause_database(tmp_path, var_names, clauses)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+        return path
+
+    # parse and convert on a miss, returns a ClauseDatabase
+    def get_or_convert(self, theorem_str):
+        db = self.get(theorem_str)
+        if db != None:
+            return db
+        prop = decode_proposition_str(theorem_str).to_cnf().simplify()
+        var_names, clauses = cnf_table_to_clauses(prop.iter_cnf(),
+                                                  prop.list_var_names(),
+                                                  tautologies=True)
+        return ClauseDatabase(self.put(theorem_str, var_names, clauses))
+
+    # remove least recently used entries until under max_bytes, except keep
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(EXTENSION):
+                path = os.path.join(self.directory, name)
+                if path == keep:
+                    continue
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for (_, size, _) in entries)
+        if keep != None:
+            total += os.path.getsize(keep)
+        for (_, size, path) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(EXTENSION):
+                os.remove(os.path.join(self.directory, name))
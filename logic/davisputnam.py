@@ -0,0 +1,296 @@
+#!/usr/bin/python3
+
+"""
+
+Davis & Putnam module :
+- manual Davis & Putnam operations on a CNF proposition, for one variable
+- operation scripts run as one batch on integer clauses, operations without
+  a variable apply to all of them (unit propagation and pure literal
+  elimination up to a fixpoint)
+
+Script : "unitpropagation; purlitteralelimination; assign A=T"
+one operation by line or separated by ";", each one followed by an optional
+variable, "assign A=T" and "assign A=F" standing for assigntrue/assignfalse.
+Scripts follow the usual Davis & Putnam rules : the negation of an assigned
+literal is removed from the remaining clauses.
+
+Sessions can be logged as DRAT proofs (see DratLog) : tautology removal and
+pure literal elimination only delete clauses, unit propagation adds the
+shortened clauses (RUP) before deleting the old ones. Assignments are
+branching steps, a session that ran one has no proof.
+
+"""
+
+from collections import Counter
+try:
+    from .propositions import *
+    from .solver import iter_clauses, cnf_table_to_clauses, clauses_to_cnf_table
+except ImportError:
+    from propositions import *
+    from solver import iter_clauses, cnf_table_to_clauses, clauses_to_cnf_table
+
+
+# operation names, as keys of app.lang.lang_operations
+operations = ["tautology", "unitpropagation", "purlitteralelimination",
+              "assigntrue", "assignfalse"]
+
+
+class DratLog:
+    """DRAT proof of a Davis & Putnam session, on integer clauses
+
+    Parameters
+    ----------
+    writer : object with add(clause) and delete(clause) methods
+        see proof.DratWriter
+    var_names : list of str
+        literal i is var_names[i-1], as for the clauses the proof is checked
+        against (proof.check_proof uses the sorted names of the proposition)
+    """
+
+    def __init__(self, writer, var_names=()):
+        self.writer = writer
+        self.var_names = list(var_names)
+        # False once a branching step ran, the clauses derived after it do
+        # not follow from the initial ones
+        self.available = True
+
+    def add(self, clause):
+        if self.available:
+            self.writer.add(clause)
+
+    def delete(self, clause):
+        if self.available:
+            self.writer.delete(clause)
+
+    # integer clauses of a CNF proposition, unknown names are appended
+    def clauses(self, prop):
+        return list(iter_clauses(prop._get_cnf_table(), self.var_names, tautologies=True))
+
+    # log the change from the before clauses to the after clauses, additions
+    # first so that they can follow from the deleted clauses
+    def update(self, before, after):
+        before = Counter(tuple(sorted(c)) for c in before)
+        after = Counter(tuple(sorted(c)) for c in after)
+        for c in (after - before).elements():
+            self.add(list(c))
+        for c in (before - after).elements():
+            self.delete(list(c))
+
+
+# apply a Davis & Putnam operation on variable (a Variable) to a CNF proposition
+# returns the resulting proposition, unchanged if the operation does not apply
+# proof : optional DratLog the operation is logged to
+def apply_operation(prop, operation, variable, proof=None):
+    if not operation in operations:
+        raise Exception("Unknown operation: {}".format(operation))
+    before = prop
+    # CNF table ands(ors)
+    cnf_table = prop._get_cnf_table()
+    # tautology operation
+    if operation == 'tautology':
+        cnf_table = [k for k in cnf_table if not (variable in k and Not(variable) in k)]
+        prop = from_cnf_table(cnf_table).simplify()
+    # unit propagation operation
+    if operation == 'unitpropagation':
+        var_prop = None
+        if [variable] in cnf_table:
+            var_prop = variable
+        elif [Not(variable)] in cnf_table:
+            var_prop = Not(variable)
+        if var_prop != None:
+            cnf_table = _make_true(cnf_table, var_prop)
+            prop = from_cnf_table(cnf_table).simplify()
+    # pur litteral elimination operation
+    if operation == 'purlitteralelimination':
+        var_prop = None
+        if True in [variable in t for t in cnf_table] and not (True in [Not(variable) in t for t in cnf_table]):
+            var_prop = variable
+        elif not (True in [variable in t for t in cnf_table]) and True in [Not(variable) in t for t in cnf_table]:
+            var_prop = Not(variable)
+        if var_prop != None:
+            cnf_table = _make_true(cnf_table, var_prop)
+            prop = from_cnf_table(cnf_table).simplify()
+    # assign true operation
+    if operation == 'assigntrue':
+        cnf_table = [t for t in cnf_table if not variable in t]
+        prop = from_cnf_table(cnf_table)
+    # assign false operation
+    if operation == 'assignfalse':
+        cnf_table = [t for t in cnf_table if not Not(variable) in t]
+        prop = from_cnf_table(cnf_table)
+    if proof != None:
+        if operation in ["assigntrue", "assignfalse"]:
+            proof.available = False
+        else:
+            proof.update(proof.clauses(before), proof.clauses(prop))
+    return prop
+
+
+# make literal true in a CNF table : its clauses are satisfied, its negation
+# is removed from the others
+def _make_true(cnf_table, literal):
+    negation = literal.arg1 if literal.__class__ == Not else Not(literal)
+    return [[T if p == literal else F if p == negation else p for p in t]
+            for t in cnf_table]
+
+
+# parse a script to a list of (operation, variable name or None)
+def parse_script(script):
+    steps = []
+    for statement in script.replace("\n", ";").split(";"):
+        words = statement.split()
+        if not words:
+            continue
+        operation, variable = words[0], " ".join(words[1:]) or None
+        if operation == "assign":
+            if variable == None or not "=" in variable:
+                raise Exception("Expected assign Variable=T or Variable=F: {}".format(statement.strip()))
+            variable, value = [w.strip() for w in variable.split("=", 1)]
+            if not value in ["T", "F"]:
+                raise Exception("Expected T or F: {}".format(statement.strip()))
+            operation = "assigntrue" if value == "T" else "assignfalse"
+        if not operation in operations:
+            raise Exception("Unknown operation: {}".format(operation))
+        if variable == None and operation in ["assigntrue", "assignfalse"]:
+            raise Exception("Missing variable: {}".format(statement.strip()))
+        steps.append((operation, variable))
+    return steps
+
+
+class ClauseState:
+    """Integer clauses with an occurrence index, simplified in place
+
+    Parameters
+    ----------
+    clauses : iterable of list of int
+    proof : DratLog
+        optional, receives the added and deleted clauses
+    """
+
+    def __init__(self, clauses, proof=None):
+        self.proof = proof
+        # clause sets by index, None once satisfied
+        self.clauses = []
+        # clause indexes by literal
+        self.occurrences = {}
+        self.assignment = {}
+        for c in clauses:
+            i = len(self.clauses)
+            self.clauses.append(set(c))
+            for l in c:
+                self.occurrences.setdefault(l, set()).add(i)
+
+    def _remove(self, i):
+        if self.proof != None:
+            self.proof.delete(sorted(self.clauses[i], key=abs))
+        for l in self.clauses[i]:
+            self.occurrences[l].discard(i)
+        self.clauses[i] = None
+
+    def assign(self, lit):
+        """Make lit true : satisfied clauses are removed, -lit is removed
+        from the others, returns the indexes of the shortened clauses"""
+        self.assignment[abs(lit)] = lit > 0
+        shortened = [i for i in self.occurrences.get(-lit, ()) if not lit in self.clauses[i]]
+        # shortened clauses follow from the unit clause by unit propagation,
+        # they are added before it is deleted
+        if self.proof != None:
+            for i in shortened:
+                self.proof.add(sorted(self.clauses[i] - {-lit}, key=abs))
+        for i in list(self.occurrences.get(lit, ())):
+            self._remove(i)
+        for i in shortened:
+            if self.proof != None:
+                self.proof.delete(sorted(self.clauses[i], key=abs))
+            self.clauses[i].discard(-lit)
+        self.occurrences.pop(-lit, None)
+        return shortened
+
+    def remove_tautologies(self, variable=None):
+        for i, c in enumerate(self.clauses):
+            if c == None:
+                continue
+            if any(-l in c for l in c if variable == None or abs(l) == variable):
+                self._remove(i)
+
+    def unit_propagate(self, variable=None):
+        """Assign unit clauses, for one variable or for all of them until
+        none is left (or the empty clause is reached)"""
+        if variable != None:
+            for lit in [variable, -variable]:
+                if any(len(self.clauses[i]) == 1 for i in self.occurrences.get(lit, ())):
+                    self.assign(lit)
+                    return
+            return
+        pending = [i for i, c in enumerate(self.clauses) if c != None and len(c) == 1]
+        while pending:
+            c = self.clauses[pending.pop()]
+            # satisfied or emptied since it was queued
+            if c == None or len(c) != 1:
+                continue
+            for i in self.assign(next(iter(c))):
+                size = len(self.clauses[i])
+                if size == 0:
+                    return
+                if size == 1:
+                    pending.append(i)
+
+    def eliminate_pure_literals(self, variable=None):
+        """Assign pure literals, for one variable or for all of them until
+        none is left"""
+        candidates = set([variable] if variable != None else
+                         [abs(l) for l, occ in self.occurrences.items() if occ])
+        while candidates:
+            v = candidates.pop()
+            pos, neg = self.occurrences.get(v), self.occurrences.get(-v)
+            if bool(pos) == bool(neg):
+                continue
+            lit = v if pos else -v
+            # variables of removed clauses may become pure
+            if variable == None:
+                for i in self.occurrences[lit]:
+                    candidates.update(abs(l) for l in self.clauses[i] if abs(l) != v)
+            self.assign(lit)
+
+    def apply(self, operation, variable=None):
+        if operation == "tautology":
+            self.remove_tautologies(variable)
+        elif operation == "unitpropagation":
+            self.unit_propagate(variable)
+        elif operation == "purlitteralelimination":
+            self.eliminate_pure_literals(variable)
+        elif operation in ["assigntrue", "assignfalse"]:
+            # branching, the remaining clauses do not follow from the others
+            if self.proof != None:
+                self.proof.available = False
+            self.assign(variable if operation == "assigntrue" else -variable)
+        else:
+            raise Exception("Unknown operation: {}".format(operation))
+
+    def remaining(self):
+        return [sorted(c, key=abs) for c in self.clauses if c != None]
+
+
+# run a script (string or parsed steps) on a CNF proposition
+# the proposition is converted once and rebuilt once, at the end
+# variables not in the proposition leave it unchanged
+# proof : optional DratLog the script is logged to
+def run_script(prop, script, proof=None):
+    if isinstance(script, str):
+        script = parse_script(script)
+    var_names, clauses = cnf_table_to_clauses(prop._get_cnf_table(),
+                                              proof.var_names if proof != None else None,
+                                              tautologies=True)
+    if proof != None:
+        proof.var_names = var_names
+    var_index = dict((name, i+1) for i, name in enumerate(var_names))
+    state = ClauseState(clauses, proof)
+    for operation, name in script:
+        if name != None and not name in var_index:
+            continue
+        state.apply(operation, var_index.get(name))
+    result = from_cnf_table(clauses_to_cnf_table(var_names, state.remaining())).simplify()
+    # the rebuilt proposition drops duplicate clauses, later steps start from it
+    if proof != None:
+        proof.update(state.remaining(), proof.clauses(result))
+    return result
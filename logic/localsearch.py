@@ -0,0 +1,208 @@
+#!/usr/bin/python3
+
+"""
+
+Local search module :
+- stochastic local search (WalkSAT, ProbSAT) over integer clauses
+- flat clause array, incremental break/make counters, O(1) unsat clause list
+- noise, flip and time budgets, usable as a first pass before exact solving
+
+"""
+
+from random import Random
+from time import perf_counter
+try:
+    from .solver import *
+    from .metrics import metrics
+except ImportError:
+    from solver import *
+    from metrics import metrics
+
+
+class LocalSearch:
+    """Stochastic local search over integer clauses
+
+    Parameters
+    ----------
+    n_vars : int
+    clauses : iterable of list of int
+    algorithm : str
+        "walksat" (noisy greedy on break counts) or "probsat"
+        (variables picked with probability cb ** -break)
+    noise : float
+        walksat probability of a random walk step
+    cb : float
+        probsat break base
+    seed : int
+    """
+
+    algorithms = ["walksat", "probsat"]
+
+    def __init__(self, n_vars, clauses, algorithm="walksat", noise=0.5, cb=2.3, seed=None):
+        if not algorithm in self.algorithms:
+            raise Exception("Unknown local search algorithm: {}".format(algorithm))
+        self.n_vars = n_vars
+        self.algorithm = algorithm
+        self.noise = noise
+        self.cb = cb
+        self.random = Random(seed)
+        self.stats = {"flips": 0, "tries": 0}
+        # flat clause array : clause c is lits[starts[c]:starts[c+1]]
+        self.lits = []
+        self.starts = [0]
+        self.inconsistent = False
+        for c in clauses:
+            c = list(dict.fromkeys(c))
+            if any(-l in c for l in c):
+                continue
+            if len(c) == 0:
+                self.inconsistent = True
+            self.lits.extend(c)
+            self.starts.append(len(self.lits))
+        self.n_clauses = len(self.starts) - 1
+        # clause indexes by literal (negative literals in the upper half)
+        self.occurrences = [[] for _ in range(2 * n_vars + 1)]
+        for c in range(self.n_clauses):
+            for k in range(self.starts[c], self.starts[c+1]):
+                self.occurrences[self.lits[k]].append(c)
+
+    # random assignment and counters from scratch
+    def _init_assignment(self):
+        random = self.random
+        self.values = [False] + [random.random() < 0.5 for _ in range(self.n_vars)]
+        # number of true literals and xor of their variables (the critical
+        # variable when there is only one) per clause
+        self.num_true = [0] * self.n_clauses
+        self.critical = [0] * self.n_clauses
+        self.breaks = [0] * (self.n_vars + 1)
+        self.makes = [0] * (self.n_vars + 1)
+        self.unsat = []
+        self.unsat_pos = [-1] * self.n_clauses
+        lits, starts, values = self.lits, self.starts, self.values
+        for c in range(self.n_clauses):
+            n, crit = 0, 0
+            for k in range(starts[c], starts[c+1]):
+                l = lits[k]
+                if values[abs(l)] == (l > 0):
+                    n += 1
+                    crit ^= abs(l)
+            self.num_true[c] = n
+            self.critical[c] = crit
+            if n == 0:
+                self._add_unsat(c)
+            elif n == 1:
+                self.breaks[crit] += 1
+
+    def _add_unsat(self, c):
+        self.unsat_pos[c] = len(self.unsat)
+        self.unsat.append(c)
+        for k in range(self.starts[c], self.starts[c+1]):
+            self.makes[abs(self.lits[k])] += 1
+
+    # swap with the last unsat clause and pop
+    def _remove_unsat(self, c):
+        pos = self.unsat_pos[c]
+        last = self.unsat.pop()
+        if last != c:
+            self.unsat[pos] = last
+            self.unsat_pos[last] = pos
+        self.unsat_pos[c] = -1
+        for k in range(self.starts[c], self.starts[c+1]):
+            self.makes[abs(self.lits[k])] -= 1
+
+    def flip(self, v):
+        self.stats["flips"] += 1
+        was_true = v if self.values[v] else -v
+        self.values[v] = not self.values[v]
+        num_true, critical, breaks = self.num_true, self.critical, self.breaks
+        # clauses where -was_true becomes true
+        for c in self.occurrences[-was_true]:
+            n = num_true[c]
+            if n == 0:
+                self._remove_unsat(c)
+                breaks[v] += 1
+            elif n == 1:
+                breaks[critical[c]] -= 1
+            num_true[c] = n + 1
+            critical[c] ^= v
+        # clauses where was_true becomes false
+        for c in self.occurrences[was_true]:
+            n = num_true[c]
+            num_true[c] = n - 1
+            critical[c] ^= v
+            if n == 1:
+                breaks[v] -= 1
+                self._add_unsat(c)
+            elif n == 2:
+                breaks[critical[c]] += 1
+
+    def _pick(self, c):
+        vs = [abs(self.lits[k]) for k in range(self.starts[c], self.starts[c+1])]
+        random = self.random
+        if self.algorithm == "probsat":
+            weights = [self.cb ** -self.breaks[v] for v in vs]
+            return random.choices(vs, weights)[0]
+        best = min(self.breaks[v] for v in vs)
+        # freebie moves are always taken, otherwise random walk with noise
+        if best > 0 and random.random() < self.noise:
+            return random.choice(vs)
+        return random.choice([v for v in vs if self.breaks[v] == best])
+
+    def search(self, max_flips=100000, max_time=None, max_tries=1):
+        """Search for a model, returns it as a list of literals or None
+
+        Parameters
+        ----------
+        max_flips : int
+            flips per try
+        max_time : float
+            overall budget in seconds, None for no limit
+        max_tries : int
+            random restarts
+        """
+        if self.inconsistent:
+            return None
+        end = perf_counter() + max_time if max_time != None else None
+        flips = self.stats["flips"]
+        try:
+            for _ in range(max_tries):
+                self.stats["tries"] += 1
+                self._init_assignment()
+                for i in range(max_flips):
+                    if not self.unsat:
+                        return self.model()
+                    # checking the clock on every flip would cost more than the flip
+                    if end != None and i % 256 == 0 and perf_counter() > end:
+                        return None
+                    c = self.unsat[self.random.randrange(len(self.unsat))]
+                    self.flip(self._pick(c))
+                if not self.unsat:
+                    return self.model()
+            return None
+        finally:
+            metrics.count("flips", self.stats["flips"] - flips)
+
+    def model(self):
+        return [v if self.values[v] else -v for v in range(1, self.n_vars+1)]
+
+
+# local search on a proposition, returns a {name: bool} satisfying dict or
+# None when no model was found within the budget (which proves nothing)
+def local_search(prop, max_flips=100000, max_time=None, max_tries=1, **options):
+    var_names, clauses = prop_to_clauses(prop)
+    model = LocalSearch(len(var_names), clauses, **options).search(max_flips, max_time, max_tries)
+    return model_to_variables(var_names, model) if model != None else None
+
+
+# quick local search first pass, then exact solving if it found nothing
+# local_options are LocalSearch/search arguments, options are Solver ones
+def solve_with_local_search(prop, local_options=None, **options):
+    local_options = dict(local_options or {})
+    budget = dict((k, local_options.pop(k)) for k in ["max_flips", "max_time", "max_tries"]
+                  if k in local_options)
+    var_names, clauses = prop_to_clauses(prop)
+    model = LocalSearch(len(var_names), clauses, **local_options).search(**budget)
+    if model == None:
+        solver = Solver(len(var_names), clauses, **options)
+        model = solver.model() if solver.solve() else None
+    return model_to_variables(var_names, model) if model != None else None
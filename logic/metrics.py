@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+
+"""
+
+Metrics module :
+- counters of events (propagations, decisions, conflicts, ...)
+- gauges of current values (clauses, literals of the current formula, ...)
+- per stage timers, recursive calls are only timed once
+- optional peak memory snapshots per stage (tracemalloc)
+- export as JSON or Prometheus text
+- everything is a no-op while disabled
+
+The shared instance is enabled by setting LOGICVIEW_METRICS in the environment,
+"memory" as value also enables peak memory snapshots.
+
+"""
+
+import json
+import re
+import tracemalloc
+from functools import wraps
+from os import environ
+from time import perf_counter
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_null_timer = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        metrics = self.metrics
+        metrics._active.add(self.name)
+        if metrics.track_memory:
+            # the peak is reset for this stage, the enclosing one keeps what
+            # it reached so far and gets this stage's peak back on exit
+            if metrics._stages:
+                outer = metrics._stages[-1]
+                outer.peak = max(outer.peak, tracemalloc.get_traced_memory()[1])
+            self.peak = 0
+            metrics._stages.append(self)
+            tracemalloc.reset_peak()
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = perf_counter() - self.start
+        metrics = self.metrics
+        metrics._active.discard(self.name)
+        timer = metrics.timers.setdefault(self.name, {"count": 0, "seconds": 0.0})
+        timer["count"] += 1
+        timer["seconds"] += elapsed
+        if metrics.track_memory and metrics._stages:
+            metrics._stages.pop()
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            metrics.peak_memory[self.name] = max(self.peak, metrics.peak_memory.get(self.name, 0))
+            if metrics._stages:
+                outer = metrics._stages[-1]
+                outer.peak = max(outer.peak, self.peak)
+        return False
+
+
+# metric names must match [a-zA-Z_:][a-zA-Z0-9_:]*, other characters become _
+def _metric_name(name):
+    name = re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+    return "_" + name if name[:1].isdigit() else name
+
+def _label_value(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    def __init__(self, enabled=False, track_memory=False):
+        self.enabled = False
+        self.track_memory = False
+        self.reset()
+        if enabled:
+            self.enable(track_memory)
+
+    def enable(self, track_memory=False):
+        self.enabled = True
+        self.track_memory = track_memory
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        self.enabled = False
+        if self.track_memory:
+            self.track_memory = False
+            tracemalloc.stop()
+
+    def reset(self):
+        self.counters = {}
+        self.gauges = {}
+        self.timers = {}
+        self.peak_memory = {}
+        self._active = set()
+        # active stages tracking memory, innermost last
+        self._stages = []
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    # add a dict of counters, e.g. Solver.stats
+    def count_all(self, counters):
+        if self.enabled:
+            for name, n in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    # current value of a gauge, e.g. the size of the current formula
+    def set(self, name, value):
+        if self.enabled:
+            self.gauges[name] = value
+
+    # context manager timing a stage, nested calls of the same stage are ignored
+    def timer(self, name):
+        if not self.enabled or name in self._active:
+            return _null_timer
+        return _Timer(self, name)
+
+    # decorator timing every call of a function as a stage
+    def timed(self, name):
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return f(*args, **kwargs)
+                with self.timer(name):
+                    return f(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def to_dict(self):
+        return {
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "timers": dict((k, dict(v)) for k, v in self.timers.items()),
+            "peak_memory": dict(self.peak_memory)
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self, prefix="logicview"):
+        lines = []
+        prefix = _metric_name(prefix)
+        def metric(name, kind, help_text, samples):
+            name = _metric_name(name)
+            lines.append("# HELP {}_{} {}".format(prefix, name, help_text))
+            lines.append("# TYPE {}_{} {}".format(prefix, name, kind))
+            for labels, value in samples:
+                lines.append("{}_{}{} {}".format(prefix, name, labels, value))
+        for name in sorted(self.counters):
+            metric(name + "_total", "counter", "Number of " + name,
+                   [("", self.counters[name])])
+        for name in sorted(self.gauges):
+            metric(name, "gauge", "Current " + name, [("", self.gauges[name])])
+        if self.timers:
+            stages = sorted(self.timers)
+            metric("stage_seconds_total", "counter", "Time spent per stage",
+                   [('{{stage="{}"}}'.format(_label_value(s)), self.timers[s]["seconds"]) for s in stages])
+            metric("stage_calls_total", "counter", "Calls per stage",
+                   [('{{stage="{}"}}'.format(_label_value(s)), self.timers[s]["count"]) for s in stages])
+        if self.peak_memory:
+            metric("stage_peak_memory_bytes", "gauge", "Peak traced memory per stage",
+                   [('{{stage="{}"}}'.format(_label_value(s)), self.peak_memory[s])
+                    for s in sorted(self.peak_memory)])
+        return "\n".join(lines) + "\n"
+
+    # one line summary, for a status bar
+    def summary(self):
+        parts = ["{}: {}".format(k, v) for k, v in sorted(self.gauges.items())]
+        parts += ["{}: {}".format(k, v) for k, v in sorted(self.counters.items())]
+        parts += ["{}: {:.1f} ms".format(k, 1000 * v["seconds"])
+                  for k, v in sorted(self.timers.items())]
+        parts += ["{} peak: {:.1f} KiB".format(k, v / 1024)
+                  for k, v in sorted(self.peak_memory.items())]
+        return " | ".join(parts)
+
+
+# shared instance used by the logic and app modules
+metrics = Metrics(enabled="LOGICVIEW_METRICS" in environ,
+                  track_memory=environ.get("LOGICVIEW_METRICS") == "memory")
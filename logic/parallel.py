@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+
+"""
+
+Parallel solving module :
+- portfolio : differently configured solvers race on the same clauses
+- cube and conquer : clauses are split on chosen variables into cubes,
+  cubes are solved in a process pool, short learnt clauses are exchanged
+  through a shared memory ring buffer
+
+"""
+
+from itertools import product
+from multiprocessing import Array, Pool, Value as SharedValue, cpu_count
+try:
+    from .solver import *
+except ImportError:
+    from solver import *
+
+
+# default portfolio : a mix of branching heuristics, phases, seeds and restarts
+def default_portfolio(size):
+    configs = []
+    for i in range(size):
+        configs.append({
+            "heuristic": Solver.heuristics[i % len(Solver.heuristics)],
+            "phase": Solver.phases[(i // len(Solver.heuristics)) % len(Solver.phases)],
+            "seed": i,
+            "restart_base": [0, 100, 32][i % 3]
+        })
+    return configs
+
+
+class ClauseExchange:
+    """Ring buffer of clauses in shared memory
+
+    A clause is stored as its length and the id of its writer followed by
+    its literals. Readers keep their own cursor, a reader too far behind
+    skips the overwritten clauses. A registered handle does not read back
+    the clauses it wrote itself.
+    """
+
+    def __init__(self, size=1 << 16, max_length=8):
+        self.size = size
+        self.max_length = max_length
+        self.buffer = Array('i', size)
+        # total number of ints ever written
+        self.written = SharedValue('q', 0)
+        # number of registered writers, 0 is the anonymous writer
+        self.writers = SharedValue('i', 0)
+        self.writer = 0
+        self.cursor = 0
+
+    # give this handle a writer id of its own
+    def register(self):
+        with self.writers.get_lock():
+            self.writers.value += 1
+            self.writer = self.writers.value
+
+    def export_clause(self, clause):
+        if len(clause) == 0 or len(clause) > self.max_length or len(clause) + 2 > self.size:
+            return
+        data = [len(clause), self.writer] + list(clause)
+        with self.written.get_lock():
+            start = self.written.value
+            for k, x in enumerate(data):
+                self.buffer[(start + k) % self.size] = x
+            self.written.value = start + len(data)
+
+    def import_clauses(self):
+        clauses = []
+        with self.written.get_lock():
+            end = self.written.value
+            # data older than one buffer length was overwritten
+            if end - self.cursor > self.size:
+                self.cursor = end
+            while self.cursor < end:
+                n = self.buffer[self.cursor % self.size]
+                writer = self.buffer[(self.cursor + 1) % self.size]
+                if writer == 0 or writer != self.writer:
+                    clauses.append([self.buffer[(self.cursor + k) % self.size]
+                                    for k in range(2, n+2)])
+                self.cursor += n + 2
+        return clauses
+
+
+# worker side state, set by the pool initializer
+_worker = {}
+
+def _init_worker(n_vars, clauses, exchange):
+    _worker["n_vars"] = n_vars
+    _worker["clauses"] = clauses
+    _worker["exchange"] = exchange
+
+def _solve_config(config):
+    solver = Solver(_worker["n_vars"], _worker["clauses"], **config)
+    return solver.model() if solver.solve() else None
+
+def _solve_cube(cube):
+    exchange = _worker["exchange"]
+    solver = Solver(_worker["n_vars"], _worker["clauses"], restart_base=100)
+    # cube literals are assumptions so that learnt clauses stay valid globally
+    # and only hold the cube literals involved in their conflicts
+    if exchange != None:
+        for c in exchange.import_clauses():
+            solver.add_clause(c)
+        # clauses of this solver are not imported back on restart
+        exchange.register()
+        solver.export_clause = exchange.export_clause
+        solver.import_clauses = exchange.import_clauses
+    return solver.model() if solver.solve(cube) else None
+
+
+def portfolio_solve(prop, configs=None, processes=None):
+    """Race several solver configurations, returns the first answer
+
+    Parameters
+    ----------
+    prop : Proposition
+    configs : list of dict
+        Solver keyword arguments, one solver per dict
+        default is default_portfolio(processes)
+    processes : int
+        number of worker processes, default is the number of CPU cores
+    """
+    processes = processes or cpu_count()
+    configs = configs or default_portfolio(processes)
+    var_names, clauses = prop_to_clauses(prop)
+    with Pool(processes, _init_worker, (len(var_names), clauses, None)) as pool:
+        # any configuration answering is conclusive : UNSAT is UNSAT for all
+        model = next(pool.imap_unordered(_solve_config, configs))
+    return model_to_variables(var_names, model) if model != None else None
+
+
+# pick the n most frequent variables to split on
+def choose_cube_variables(clauses, n):
+    occurrences = {}
+    for c in clauses:
+        for l in c:
+            occurrences[abs(l)] = occurrences.get(abs(l), 0) + 1
+    return sorted(occurrences, key=lambda v: (-occurrences[v], v))[:n]
+
+def make_cubes(cube_vars):
+    for signs in product([1, -1], repeat=len(cube_vars)):
+        yield [s * v for s, v in zip(signs, cube_vars)]
+
+
+def cube_and_conquer(prop, cube_vars=None, depth=None, processes=None,
+                     exchange_size=1 << 16, max_shared_length=8):
+    """Split on cube variables and solve the cubes in a process pool
+
+    Parameters
+    ----------
+    prop : Proposition
+    cube_vars : list of str
+        names of the variables to split on
+        default is the depth most frequent variables
+    depth : int
+        number of split variables when cube_vars is not given
+        default gives about 4 cubes per process
+    processes : int
+        number of worker processes, default is the number of CPU cores
+    exchange_size : int
+        size in ints of the shared learnt clause buffer, 0 disables sharing
+    max_shared_length : int
+        only learnt clauses up to this length are shared
+    """
+    processes = processes or cpu_count()
+    var_names, clauses = prop_to_clauses(prop)
+    if cube_vars != None:
+        cube_vars = [var_names.index(name) + 1 for name in cube_vars]
+    else:
+        if depth == None:
+            depth = (4 * processes - 1).bit_length()
+        cube_vars = choose_cube_variables(clauses, depth)
+    exchange = None
+    if exchange_size > 0:
+        exchange = ClauseExchange(exchange_size, max_shared_length)
+    with Pool(processes, _init_worker, (len(var_names), clauses, exchange)) as pool:
+        # the first model found wins, otherwise every cube was unsatisfiable
+        for model in pool.imap_unordered(_solve_cube, make_cubes(cube_vars)):
+            if model != None:
+                return model_to_variables(var_names, model)
+    return None
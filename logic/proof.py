@@ -0,0 +1,341 @@
+#!/usr/bin/python3
+
+"""
+
+Proof module :
+- write unsatisfiability proofs as binary DRAT, buffered
+- read binary DRAT proofs
+- backward DRAT checking with core-first unit propagation
+
+"""
+
+try:
+    from .solver import *
+except ImportError:
+    from solver import *
+
+
+# binary DRAT : 'a' or 'd', then literals as variable length unsigned ints
+# (2*v for v, 2*v+1 for -v, 7 bits per byte, lowest bits first), then 0
+ADD, DELETE = 0x61, 0x64
+
+
+class DratWriter:
+    """Binary DRAT proof writer
+
+    Parameters
+    ----------
+    target : str or binary file object
+        path of the proof file, or an already opened file
+    buffer_size : int
+        number of bytes kept in memory before writing to the file
+    """
+
+    def __init__(self, target, buffer_size=1 << 16):
+        self._owned = not hasattr(target, "write")
+        self.file = open(target, "wb") if self._owned else target
+        self.buffer = bytearray()
+        self.buffer_size = buffer_size
+
+    def add(self, clause):
+        self._write(ADD, clause)
+
+    def delete(self, clause):
+        self._write(DELETE, clause)
+
+    def _write(self, kind, clause):
+        buffer = self.buffer
+        buffer.append(kind)
+        for l in clause:
+            u = 2 * l if l > 0 else 1 - 2 * l
+            while u > 127:
+                buffer.append((u & 127) | 128)
+                u >>= 7
+            buffer.append(u)
+        buffer.append(0)
+        if len(buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.buffer.clear()
+
+    def close(self):
+        self.flush()
+        if self._owned:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# yields (deleted, clause) steps of a binary DRAT proof given as path or bytes
+def read_drat(source):
+    if isinstance(source, (bytes, bytearray)):
+        data = source
+    else:
+        with open(source, "rb") as f:
+            data = f.read()
+    i, n = 0, len(data)
+    while i < n:
+        kind = data[i]
+        if kind != ADD and kind != DELETE:
+            raise Exception("Invalid binary DRAT step at byte {}".format(i))
+        i += 1
+        clause = []
+        u, shift = 0, 0
+        while True:
+            if i >= n:
+                raise Exception("Unexpected end of binary DRAT proof")
+            b = data[i]
+            i += 1
+            u |= (b & 127) << shift
+            if b & 128:
+                shift += 7
+                continue
+            if u == 0:
+                break
+            clause.append(u >> 1 if u & 1 == 0 else -(u >> 1))
+            u, shift = 0, 0
+        yield kind == DELETE, clause
+
+
+class _Clause:
+    __slots__ = ("lits", "pivot", "active", "core")
+
+    def __init__(self, lits):
+        self.lits = lits
+        # lits are reordered by the watches, the RAT pivot is kept apart
+        self.pivot = lits[0] if lits else None
+        self.active = True
+        self.core = False
+
+
+class DratChecker:
+    """Backward DRAT checker
+
+    Lemmas are checked from the empty clause backwards, only lemmas that
+    were used to derive a checked clause (the core) are checked.
+    Unit propagation runs on core clauses first, and only falls back to
+    other clauses when core clauses are at fixpoint, to keep cores small.
+    """
+
+    def __init__(self, n_vars, clauses):
+        self.n_vars = n_vars
+        # literal indexed, as in Solver
+        self.values = [0] * (2 * n_vars + 1)
+        self.reasons = [None] * (n_vars + 1)
+        self.watches = [[] for _ in range(2 * n_vars + 1)]
+        self.units = []
+        self.clauses = [self._add(list(c)) for c in clauses]
+        self.stats = {"lemmas": 0, "checked": 0, "rat": 0, "core": 0}
+
+    def _add(self, lits):
+        lits = list(dict.fromkeys(lits))
+        c = _Clause(lits)
+        for l in lits:
+            if abs(l) > self.n_vars:
+                raise Exception("Literal {} out of range".format(l))
+        if len(lits) == 1:
+            self.units.append(c)
+        elif len(lits) > 1:
+            self.watches[lits[0]].append(c)
+            self.watches[lits[1]].append(c)
+        return c
+
+    def _assign(self, lit, reason):
+        self.values[lit] = 1
+        self.values[-lit] = -1
+        self.reasons[abs(lit)] = reason
+        self.trail.append(lit)
+
+    # propagate watches of false_lit on core or non core clauses
+    # returns (conflict clause, new assignment made)
+    def _propagate_lit(self, false_lit, core, stop_on_assign):
+        values = self.values
+        watch_list = self.watches[false_lit]
+        kept = []
+        assigned = False
+        for i, c in enumerate(watch_list):
+            if not c.active or c.core != core or (stop_on_assign and assigned):
+                kept.append(c)
+                continue
+            lits = c.lits
+            if lits[0] == false_lit:
+                lits[0], lits[1] = lits[1], lits[0]
+            if values[lits[0]] == 1:
+                kept.append(c)
+                continue
+            for k in range(2, len(lits)):
+                if values[lits[k]] != -1:
+                    lits[1], lits[k] = lits[k], lits[1]
+                    self.watches[lits[1]].append(c)
+                    break
+            else:
+                kept.append(c)
+                if values[lits[0]] == -1:
+                    kept.extend(watch_list[i+1:])
+                    self.watches[false_lit] = kept
+                    return c, assigned
+                self._assign(lits[0], c)
+                assigned = True
+        self.watches[false_lit] = kept
+        return None, assigned
+
+    # core-first unit propagation from the current trail
+    def _propagate(self):
+        core_head, head = 0, 0
+        while True:
+            while core_head < len(self.trail):
+                conflict, _ = self._propagate_lit(-self.trail[core_head], True, False)
+                core_head += 1
+                if conflict != None:
+                    return conflict
+            # core at fixpoint, find one non core implication then go back to core
+            assigned = False
+            while head < len(self.trail) and not assigned:
+                conflict, assigned = self._propagate_lit(-self.trail[head], False, True)
+                if conflict != None:
+                    return conflict
+                if not assigned:
+                    head += 1
+            if not assigned:
+                return None
+
+    # mark every clause involved in the conflict as core
+    def _analyze(self, conflict):
+        seen = set()
+        stack = [conflict]
+        while stack:
+            c = stack.pop()
+            if not c.core:
+                c.core = True
+                self.stats["core"] += 1
+            for l in c.lits:
+                v = abs(l)
+                if v in seen:
+                    continue
+                seen.add(v)
+                reason = self.reasons[v]
+                if reason != None and reason is not c:
+                    stack.append(reason)
+
+    def _reset(self):
+        for lit in self.trail:
+            self.values[lit] = 0
+            self.values[-lit] = 0
+            self.reasons[abs(lit)] = None
+        self.trail = []
+
+    # reverse unit propagation check of lits, marks the core on success
+    def _rup(self, lits):
+        self.trail = []
+        try:
+            for l in lits:
+                if self.values[l] == 1:
+                    return True
+                if self.values[l] == 0:
+                    self._assign(-l, None)
+            for c in self.units:
+                if not c.active:
+                    continue
+                l = c.lits[0]
+                if self.values[l] == -1:
+                    self._analyze(c)
+                    return True
+                if self.values[l] == 0:
+                    self._assign(l, c)
+            conflict = self._propagate()
+            if conflict == None:
+                return False
+            self._analyze(conflict)
+            return True
+        finally:
+            self._reset()
+
+    # resolution asymmetric tautology check of a lemma on its pivot, the
+    # first literal it was written with
+    def _rat(self, lemma):
+        if lemma.pivot == None:
+            return False
+        lits, pivot = lemma.lits, lemma.pivot
+        for c in self._active_clauses():
+            if -pivot in c.lits:
+                resolvent = lits + [l for l in c.lits if l != -pivot]
+                if not self._rup(resolvent):
+                    return False
+                if not c.core:
+                    c.core = True
+                    self.stats["core"] += 1
+        return True
+
+    def _active_clauses(self):
+        for c in self.clauses:
+            if c.active:
+                yield c
+
+    def check(self, proof):
+        """Check a proof given as an iterable of (deleted, clause) steps
+
+        Returns True if the proof derives the empty clause and every
+        lemma it depends on is RUP or RAT
+        """
+        # forward pass : replay additions and deletions until the empty clause
+        steps = []
+        index = {}
+        for c in self.clauses:
+            index.setdefault(tuple(sorted(c.lits)), []).append(c)
+        has_empty = any(len(c.lits) == 0 for c in self.clauses)
+        for deleted, lits in proof:
+            if has_empty:
+                break
+            key = tuple(sorted(set(lits)))
+            if deleted:
+                candidates = index.get(key)
+                # unit deletions are ignored, as most checkers do
+                if candidates and len(key) > 1:
+                    c = candidates.pop()
+                    c.active = False
+                    steps.append((True, c))
+            else:
+                c = self._add(lits)
+                self.clauses.append(c)
+                index.setdefault(key, []).append(c)
+                steps.append((False, c))
+                self.stats["lemmas"] += 1
+                if len(lits) == 0:
+                    has_empty = True
+        if not has_empty:
+            # the proof may also stop once the empty clause is RUP
+            if not self._rup([]):
+                return False
+        # backward pass
+        for deleted, c in reversed(steps):
+            if deleted:
+                c.active = True
+                continue
+            c.active = False
+            if not c.core and len(c.lits) > 0:
+                continue
+            self.stats["checked"] += 1
+            if not self._rup(c.lits):
+                self.stats["rat"] += 1
+                if not self._rat(c):
+                    return False
+        return True
+
+
+def check_drat(n_vars, clauses, proof):
+    """Check a binary DRAT proof (path or bytes) of unsatisfiability of clauses"""
+    return DratChecker(n_vars, clauses).check(read_drat(proof))
+
+
+# check a proof written while solving prop with solve(prop, proof=...)
+def check_proof(prop, proof):
+    var_names, clauses = prop_to_clauses(prop)
+    return check_drat(len(var_names), clauses, proof)
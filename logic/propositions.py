@@ -21,6 +21,10 @@ from abc import ABC, abstractmethod
 from inspect import signature
 from itertools import product, chain
 from re import search
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
 
 
 # Abstract class Proposition : abstract evaluate, priority management
@@ -52,6 +56,25 @@ class Proposition(ABC):
         """
         pass
 
+    # vectorized evaluation, should be overwritten with evaluate
+    def evaluate_vector(self, columns, ones):
+        """Evaluate self on many inputs at once with bitwise operations
+
+        Parameters
+        ----------
+        columns : dict
+            Description:
+                * dict of bit vectors for every named variable, one bit per input
+                * bit vectors are Python ints (bit i is input i) or numpy bool arrays
+                * same requirements on names as in evaluate
+            Example:
+                {'A': 0b0011, 'B': 0b0101}
+        ones : int or numpy bool array
+            bit vector of all true inputs, e.g. 0b1111
+        """
+        raise Exception("No vectorized evaluation defined for class {}"
+                        .format(self.__class__.__name__))
+
     # used in __str__ to enclose properly according to priority
     def enclose_priority(self, arg):
             if arg.__class__ in self._upper_priority_prop_class_list:
@@ -101,6 +124,7 @@ class Proposition(ABC):
             print("False case input values :", *variables_str)
 
     # should NOT be overwritten
+    @metrics.timed("simplify")
     def simplify(self):
         # Value and Variable can't be simplified, bottom reached
         if self.__class__ in [Value, Variable]:
@@ -124,28 +148,37 @@ class Proposition(ABC):
 
     # returns CNF equivalent Proposition of self
     # must not be overwritten
+    @metrics.timed("to_cnf")
     def to_cnf(self):
-        # build CNF table as described before _build_cnf declaration above
+        # build CNF table as described before _iter_cnf declaration above
         cnf_table = self._get_cnf_table()
         return from_cnf_table(cnf_table)
 
-    # construct a 2 depth list : first layers for And, second layer for Or
-    # describing cnf locally in the tree
-    # this first allows for easier concatenations
-    def _build_cnf(self):
+    # yield the clauses (lists of literals, for Or) of the CNF (And of them)
+    # one at a time, describing cnf locally in the tree
+    # nothing is materialized but the clause being yielded
+    def _iter_cnf(self):
         print("WARNING : No local CNF defined for class", self.__class__.__name__)
-        return [[self]]
+        yield [self]
+
+    # stream CNF clauses without duplicates, as lists of distinct literals
+    # only the set of already seen clauses is kept in memory
+    # with tautologies=False, clauses containing T or both A and -A are skipped
+    def iter_cnf(self, tautologies=True):
+        seen = set()
+        for t in self._iter_cnf():
+            clause = frozenset(t)
+            if clause in seen:
+                continue
+            seen.add(clause)
+            if not tautologies and (T in clause or
+                    any(p.__class__ == Not and p.arg1 in clause for p in clause)):
+                continue
+            yield list(clause)
 
     # get cnf table without duplicates
     def _get_cnf_table(self):
-        table = [list(set(t)) for t in self._build_cnf()]
-        table_str = [sorted([str(p) for p in t]) for t in table]
-        p_table, s_table = [], []
-        for (t, s) in zip(table, table_str):
-            if not s in s_table:
-                p_table.append(t)
-                s_table.append(s)
-        return p_table
+        return list(self.iter_cnf())
 
     # in most case, should NOT be overwritten
     def __str__(self):
@@ -177,8 +210,11 @@ class Value(Proposition):
     def evaluate(self, variables):
         return self.value
 
-    def _build_cnf(self):
-        return [[self]]
+    def evaluate_vector(self, columns, ones):
+        return ones if self.value else ones ^ ones
+
+    def _iter_cnf(self):
+        yield [self]
 
     def __str__(self):
         return "T" if self.value else "F"
@@ -202,11 +238,14 @@ class Variable(Proposition):
                                                         str_varlist))
         return variables[self._name]
 
+    def evaluate_vector(self, columns, ones):
+        return self.evaluate(columns)
+
     def _local_simplify(self):
         return self
 
-    def _build_cnf(self):
-        return [[self]]
+    def _iter_cnf(self):
+        yield [self]
 
     # only exception
     def __str__(self):
@@ -227,6 +266,9 @@ class Not(Proposition):
     def evaluate(self, variables):
         return not self.arg1.evaluate(variables)
 
+    def evaluate_vector(self, columns, ones):
+        return ones ^ self.arg1.evaluate_vector(columns, ones)
+
     def _local_simplify(self):
         arg1_simplified = self.arg1.simplify()
         if arg1_simplified == T:
@@ -238,16 +280,25 @@ class Not(Proposition):
         else:
             return self
 
-    def _build_cnf(self):
-        if self.arg1.__class__ == Not:
-            return self.arg1.arg1._build_cnf()
-        p = self.arg1.to_cnf()
-        if p.__class__ == Variable:
-            return [[self]]
-        if p.__class__ == And:
-            return Or(Not(self.arg1.arg1.to_cnf()), Not(self.arg1.arg2.to_cnf()))._build_cnf()
-        if p.__class__ == Or:
-            return And(Not(self.arg1.arg1.to_cnf()), Not(self.arg1.arg2.to_cnf()))._build_cnf()
+    # push the negation down to the variables
+    def _iter_cnf(self):
+        arg = self.arg1
+        if arg.__class__ == Variable:
+            yield [self]
+        elif arg.__class__ == Value:
+            yield [F if arg.value else T]
+        elif arg.__class__ == Not:
+            yield from arg.arg1._iter_cnf()
+        elif arg.__class__ == And:
+            yield from Or(Not(arg.arg1), Not(arg.arg2))._iter_cnf()
+        elif arg.__class__ == Or:
+            yield from And(Not(arg.arg1), Not(arg.arg2))._iter_cnf()
+        elif arg.__class__ == Implies:
+            yield from And(arg.arg1, Not(arg.arg2))._iter_cnf()
+        elif arg.__class__ == Equivalent:
+            yield from Or(And(arg.arg1, Not(arg.arg2)), And(Not(arg.arg1), arg.arg2))._iter_cnf()
+        else:
+            yield from Not(arg.to_cnf())._iter_cnf()
 
 # "And" class and following classes follow "Not" class example
 class And(Proposition):
@@ -261,6 +312,9 @@ class And(Proposition):
     def evaluate(self, variables):
         return self.arg1.evaluate(variables) and self.arg2.evaluate(variables)
 
+    def evaluate_vector(self, columns, ones):
+        return self.arg1.evaluate_vector(columns, ones) & self.arg2.evaluate_vector(columns, ones)
+
     def _local_simplify(self):
         if self.arg1 == T:
             return self.arg2
@@ -271,10 +325,9 @@ class And(Proposition):
         else:
             return self
 
-    def _build_cnf(self):
-        p = self.arg1._build_cnf()
-        q = self.arg2._build_cnf()
-        return p + q
+    def _iter_cnf(self):
+        yield from self.arg1._iter_cnf()
+        yield from self.arg2._iter_cnf()
 
 
 class Or(Proposition):
@@ -288,6 +341,9 @@ class Or(Proposition):
     def evaluate(self, variables):
         return self.arg1.evaluate(variables) or self.arg2.evaluate(variables)
 
+    def evaluate_vector(self, columns, ones):
+        return self.arg1.evaluate_vector(columns, ones) | self.arg2.evaluate_vector(columns, ones)
+
     def _local_simplify(self):
         if self.arg1 == F:
             return self.arg2
@@ -298,10 +354,11 @@ class Or(Proposition):
         else:
             return self
 
-    def _build_cnf(self):
-        p = self.arg1._build_cnf()
-        q = self.arg2._build_cnf()
-        return [pi+qi for pi in p for qi in q]
+    # distribution, arg2 clauses are generated again for every arg1 clause
+    def _iter_cnf(self):
+        for p in self.arg1._iter_cnf():
+            for q in self.arg2._iter_cnf():
+                yield p + q
 
 
 class Implies(Proposition):
@@ -316,6 +373,9 @@ class Implies(Proposition):
     def evaluate(self, variables):
         return (not self.arg1.evaluate(variables)) or self.arg2.evaluate(variables)
 
+    def evaluate_vector(self, columns, ones):
+        return (ones ^ self.arg1.evaluate_vector(columns, ones)) | self.arg2.evaluate_vector(columns, ones)
+
     def _local_simplify(self):
         if self.arg2 == T:
             return T
@@ -328,8 +388,8 @@ class Implies(Proposition):
         else:
             return self
 
-    def _build_cnf(self):
-        return Or(Not(self.arg1), self.arg2)._build_cnf()
+    def _iter_cnf(self):
+        return Or(Not(self.arg1), self.arg2)._iter_cnf()
 
 
 class Equivalent(Proposition):
@@ -346,6 +406,11 @@ class Equivalent(Proposition):
         vB = self.arg2.evaluate(variables)
         return (vA and vB) or ((not vA) and (not vB))
 
+    def evaluate_vector(self, columns, ones):
+        vA = self.arg1.evaluate_vector(columns, ones)
+        vB = self.arg2.evaluate_vector(columns, ones)
+        return ones ^ (vA ^ vB)
+
     def _local_simplify(self):
         if self.arg2 == T:
             return self.arg1
@@ -358,8 +423,8 @@ class Equivalent(Proposition):
         else:
             return self
 
-    def _build_cnf(self):
-        return Or(And(self.arg1, self.arg2), And(Not(self.arg1), Not(self.arg2)))._build_cnf()
+    def _iter_cnf(self):
+        return Or(And(self.arg1, self.arg2), And(Not(self.arg1), Not(self.arg2)))._iter_cnf()
 
 
 # build all (variable, True or False) dict for proposition testing
@@ -388,6 +453,7 @@ def print_truth_table(prop_class):
 
 
 # "One does not simply 'eval' a user input"
+@metrics.timed("parse")
 def decode_proposition_str(theorem_str):
     # remove spaces and newlines
     theorem_str = theorem_str.replace(" ", "")
@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+
+"""
+
+Simulation module :
+- evaluate a proposition over large assignment datasets (CSV or NumPy .npy)
+- datasets are streamed by chunks, .npy files are memory-mapped
+- columns are mapped to the proposition variables by name
+- chunks are evaluated at once with bitwise operations (evaluate_vector),
+  on Python ints used as bit vectors, or on numpy bool arrays
+- pass/fail masks are written as packed bits, first violating rows are kept
+  and can be written as CSV
+
+"""
+
+import csv
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    from .propositions import *
+except ImportError:
+    from propositions import *
+
+
+TRUE_STRINGS = {"1", "t", "true", "y", "yes"}
+FALSE_STRINGS = {"0", "f", "false", "n", "no", ""}
+
+
+def parse_bool(s):
+    s = s.strip().lower()
+    if s in TRUE_STRINGS:
+        return True
+    if s in FALSE_STRINGS:
+        return False
+    raise Exception("Not a truth value: {}".format(s))
+
+
+class SimulationResult:
+    def __init__(self):
+        self.rows = 0
+        self.failures = 0
+        # (row index, {name: bool}) of the first failing rows
+        self.violations = []
+
+    @property
+    def passed(self):
+        return self.failures == 0
+
+    def __str__(self):
+        return "{} rows, {} failures".format(self.rows, self.failures)
+
+
+# check every variable of prop has a column
+def _check_columns(var_names, column_names):
+    missing = [name for name in var_names if not name in column_names]
+    if missing:
+        raise Exception("Variables without column in the dataset: {}".format(", ".join(missing)))
+
+
+# yields (columns as int bit vectors, number of rows) for chunks of a CSV file
+# the first line of the file holds the column names
+def read_csv_chunks(path, var_names, chunk_size=65536):
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader)]
+        _check_columns(var_names, header)
+        indexes = [header.index(name) for name in var_names]
+        while True:
+            rows = []
+            for row in reader:
+                rows.append(row)
+                if len(rows) == chunk_size:
+                    break
+            if not rows:
+                return
+            columns = {}
+            for name, i in zip(var_names, indexes):
+                # row 0 is the lowest bit, so the string is reversed
+                bits = "".join("1" if parse_bool(row[i]) else "0" for row in reversed(rows))
+                columns[name] = int(bits, 2)
+            yield columns, len(rows)
+            if len(rows) < chunk_size:
+                return
+
+
+# yields (columns as numpy bool arrays, number of rows) for chunks of a .npy file
+# the array is either structured (field names are column names) or 2D with
+# column_names given
+def read_npy_chunks(path, var_names, chunk_size=65536, column_names=None):
+    if numpy == None:
+        raise Exception("numpy is required to read .npy files")
+    data = numpy.load(path, mmap_mode="r")
+    if data.dtype.names != None:
+        _check_columns(var_names, data.dtype.names)
+        column = lambda chunk, name: chunk[name]
+    else:
+        if column_names == None or data.ndim != 2 or data.shape[1] != len(column_names):
+            raise Exception("Column names are required for {} array".format(data.shape))
+        _check_columns(var_names, column_names)
+        indexes = dict((name, i) for i, name in enumerate(column_names))
+        column = lambda chunk, name: chunk[:, indexes[name]]
+    for start in range(0, data.shape[0], chunk_size):
+        chunk = data[start:start+chunk_size]
+        yield dict((name, numpy.asarray(column(chunk, name), dtype=bool))
+                   for name in var_names), chunk.shape[0]
+
+
+def _failing_rows(fail, n):
+    if numpy != None and isinstance(fail, numpy.ndarray):
+        for i in numpy.flatnonzero(fail)[:n]:
+            yield int(i)
+        return
+    # lowest set bits first
+    while fail and n > 0:
+        low = fail & -fail
+        yield low.bit_length() - 1
+        fail ^= low
+        n -= 1
+
+
+def _packed_mask(result, n):
+    if numpy != None and isinstance(result, numpy.ndarray):
+        return numpy.packbits(result, bitorder="little").tobytes()
+    return result.to_bytes((n + 7) // 8, "little")
+
+
+def _bit(column, i):
+    return bool(column[i]) if not isinstance(column, int) else bool(column >> i & 1)
+
+
+# CSV of the violating rows : row index then a column per variable
+def write_violations(path, var_names, violations):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["row"] + var_names)
+        for i, row in violations:
+            writer.writerow([i] + [1 if row[name] else 0 for name in var_names])
+
+
+def simulate(prop, path, mask_path=None, max_violations=10, chunk_size=65536,
+             column_names=None, violations_path=None):
+    """Evaluate prop on every row of a dataset
+
+    Parameters
+    ----------
+    prop : Proposition or AIG
+        an AIG (see aig.proposition_to_aig) shares repeated subformulas
+    path : str
+        CSV file with a header line, or .npy file
+    mask_path : str
+        if given, the pass mask is written there as packed bits
+        (bit i of the file, lowest bit first, is 1 if row i passed)
+    max_violations : int
+        number of failing rows kept in the result
+    chunk_size : int
+        rows evaluated at once, multiple of 8
+    column_names : list of str
+        column names of a 2D .npy array
+    violations_path : str
+        if given, the kept violating rows are written there as CSV
+        (see write_violations)
+
+    Returns a SimulationResult
+    """
+    if chunk_size % 8 != 0:
+        raise Exception("Chunk size must be a multiple of 8: {}".format(chunk_size))
+    var_names = prop.list_var_names()
+    if path.endswith(".npy"):
+        chunks = read_npy_chunks(path, var_names, chunk_size, column_names)
+    else:
+        chunks = read_csv_chunks(path, var_names, chunk_size)
+    result = SimulationResult()
+    mask_file = open(mask_path, "wb") if mask_path != None else None
+    try:
+        for columns, n in chunks:
+            if path.endswith(".npy"):
+                ones = numpy.ones(n, dtype=bool)
+            else:
+                ones = (1 << n) - 1
+            passed = prop.evaluate_vector(columns, ones)
+            fail = ones ^ passed
+            if mask_file != None:
+                mask_file.write(_packed_mask(passed, n))
+            n_fail = int(fail.sum()) if not isinstance(fail, int) else bin(fail).count("1")
+            missing = max_violations - len(result.violations)
+            for i in _failing_rows(fail, min(missing, n_fail)):
+                row = dict((name, _bit(columns[name], i)) for name in var_names)
+                result.violations.append((result.rows + i, row))
+            result.rows += n
+            result.failures += n_fail
+    finally:
+        if mask_file != None:
+            mask_file.close()
+    if violations_path != None:
+        write_violations(violations_path, var_names, result.violations)
+    return result
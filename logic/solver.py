@@ -0,0 +1,407 @@
+#!/usr/bin/python3
+
+"""
+
+Solver module :
+- integer clause database built from a CNF table (DIMACS-like literals)
+- DPLL search with watched literals, 1-UIP conflict clause learning and restarts
+- configurable branching heuristic, phase, seed and restart policy
+
+"""
+
+from random import Random
+from time import time
+try:
+    from .propositions import *
+    from .metrics import metrics
+except ImportError:
+    from propositions import *
+    from metrics import metrics
+
+
+# convert CNF clauses (as yielded by Proposition.iter_cnf) to integers, lazily
+# yields clauses of non zero integers, i meaning var_names[i-1] and -i meaning
+# Not(var_names[i-1]), unknown names are appended to var_names
+# tautologies are dropped unless asked for
+def iter_clauses(cnf_table, var_names, tautologies=False):
+    var_index = dict((name, i+1) for i, name in enumerate(var_names))
+    for t in cnf_table:
+        clause = set()
+        satisfied = False
+        for p in t:
+            # T satisfies the clause, F can be dropped
+            if p.__class__ == Value:
+                if p.value:
+                    satisfied = True
+                    break
+                continue
+            if p.__class__ == Not:
+                name, sign = str(p.arg1), -1
+            else:
+                name, sign = str(p), 1
+            if not name in var_index:
+                var_names.append(name)
+                var_index[name] = len(var_names)
+            clause.add(sign * var_index[name])
+        if satisfied:
+            continue
+        if not tautologies and any(-l in clause for l in clause):
+            continue
+        yield sorted(clause, key=abs)
+
+
+# convert a CNF table (as returned by Proposition._get_cnf_table) to integers
+# returns the variable names and the list of clauses, see iter_clauses
+def cnf_table_to_clauses(cnf_table, var_names=None, tautologies=False):
+    var_names = list(var_names) if var_names != None else []
+    clauses = list(iter_clauses(cnf_table, var_names, tautologies))
+    return var_names, clauses
+
+
+# integer clauses of a proposition, streamed from its tree
+def prop_to_clauses(prop):
+    return cnf_table_to_clauses(prop.iter_cnf(tautologies=False),
+                                prop.list_var_names())
+
+
+# stream the CNF of a proposition to a text file in DIMACS format
+# the header is written last, the file must be seekable
+# returns the variable names, variable i is var_names[i-1]
+def write_dimacs(prop, f):
+    var_names = prop.list_var_names()
+    # room for the header, filled in once the clauses are counted
+    header_format = "p cnf {:>10} {:>12}"
+    start = f.tell()
+    f.write(" " * len(header_format.format(0, 0)) + "\n")
+    n_clauses = 0
+    for c in iter_clauses(prop.iter_cnf(tautologies=False), var_names):
+        f.write(" ".join(str(l) for l in c) + " 0\n")
+        n_clauses += 1
+    end = f.tell()
+    f.seek(start)
+    f.write(header_format.format(len(var_names), n_clauses))
+    f.seek(end)
+    return var_names
+
+
+# inverse of cnf_table_to_clauses, the empty clause becomes [F]
+def clauses_to_cnf_table(var_names, clauses):
+    def literal(l):
+        v = Variable(var_names[abs(l)-1])
+        return v if l > 0 else Not(v)
+    return [[literal(l) for l in c] or [F] for c in clauses]
+
+
+# convert an integer model to a {name: bool} dict
+def model_to_variables(var_names, model):
+    return dict((var_names[abs(l)-1], l > 0) for l in model)
+
+
+# luby restart sequence : 1 1 2 1 1 2 4 1 1 2 1 1 2 4 8 ...
+def luby(i):
+    size, seq = 1, 0
+    while size < i + 1:
+        seq += 1
+        size = 2 * size + 1
+    while size - 1 != i:
+        size = (size - 1) >> 1
+        seq -= 1
+        i = i % size
+    return 1 << seq
+
+
+class Solver:
+    """DPLL solver over integer clauses
+
+    Parameters
+    ----------
+    n_vars : int
+        number of variables, literals are in [-n_vars, n_vars] \\ {0}
+    clauses : iterable of list of int
+    heuristic : str
+        branching order, one of "first", "occurrence" or "random"
+    phase : str
+        first value tried on a decision, one of "positive", "negative",
+        "polarity" (most frequent sign) or "random"
+    seed : int
+        seed of the random generator used by "random" heuristic and phase
+    restart_base : int
+        restart after restart_base * luby(k) conflicts, 0 disables restarts
+    deadline : float
+        time() after which solve raises an Exception, None for no limit
+    """
+
+    heuristics = ["first", "occurrence", "random"]
+    phases = ["positive", "negative", "polarity", "random"]
+
+    def __init__(self, n_vars, clauses, heuristic="occurrence", phase="positive",
+                 seed=None, restart_base=0, deadline=None):
+        if not heuristic in self.heuristics:
+            raise Exception("Unknown branching heuristic: {}".format(heuristic))
+        if not phase in self.phases:
+            raise Exception("Unknown phase: {}".format(phase))
+        self.n_vars = n_vars
+        self.heuristic = heuristic
+        self.phase = phase
+        self.random = Random(seed)
+        self.restart_base = restart_base
+        self.deadline = deadline
+        # values indexed by literal : negative indexes land in the upper half
+        # 1 is true, -1 is false, 0 is unassigned
+        self.values = [0] * (2 * n_vars + 1)
+        # decision level and reason clause of every assigned variable
+        self.levels = [0] * (n_vars + 1)
+        self.reasons = [None] * (n_vars + 1)
+        self.watches = [[] for _ in range(2 * n_vars + 1)]
+        self.trail = []
+        self.trail_lim = []
+        self.decisions = []
+        self.qhead = 0
+        self.inconsistent = False
+        self.stats = {"decisions": 0, "propagations": 0, "conflicts": 0,
+                      "restarts": 0, "learnt": 0}
+        # optional hooks
+        # proof : object with an add(clause) method, receives every lemma
+        # export_clause : called with every learnt clause
+        # import_clauses : called on restart, returns clauses to add
+        self.proof = None
+        self.export_clause = None
+        self.import_clauses = None
+        occurrences = [0] * (2 * n_vars + 1)
+        for c in clauses:
+            for l in c:
+                occurrences[l] += 1
+            self.add_clause(c)
+        self._init_order(occurrences)
+
+    def _init_order(self, occurrences):
+        order = list(range(1, self.n_vars+1))
+        if self.heuristic == "occurrence":
+            order.sort(key=lambda v: -(occurrences[v] + occurrences[-v]))
+        elif self.heuristic == "random":
+            self.random.shuffle(order)
+        self.order = order
+        self.polarity = [occurrences[v] >= occurrences[-v] for v in range(self.n_vars+1)]
+
+    def value(self, lit):
+        return self.values[lit]
+
+    # add a clause at level 0, literals false at level 0 are dropped
+    def add_clause(self, clause):
+        if self.trail_lim:
+            self._backtrack(0)
+        clause = list(dict.fromkeys(clause))
+        if any(-l in clause for l in clause) or any(self.values[l] == 1 for l in clause):
+            return
+        clause = [l for l in clause if self.values[l] == 0]
+        if len(clause) == 0:
+            self.inconsistent = True
+        elif len(clause) == 1:
+            self._assign(clause[0])
+        else:
+            self.watches[clause[0]].append(clause)
+            self.watches[clause[1]].append(clause)
+
+    def _assign(self, lit, reason=None):
+        self.values[lit] = 1
+        self.values[-lit] = -1
+        self.levels[abs(lit)] = len(self.trail_lim)
+        self.reasons[abs(lit)] = reason
+        self.trail.append(lit)
+
+    def _decide(self, lit):
+        self.trail_lim.append(len(self.trail))
+        self.decisions.append(lit)
+        if lit != None:
+            self.stats["decisions"] += 1
+            self._assign(lit)
+
+    def _backtrack(self, level):
+        if len(self.trail_lim) <= level:
+            return
+        stop = self.trail_lim[level]
+        for lit in self.trail[stop:]:
+            self.values[lit] = 0
+            self.values[-lit] = 0
+        del self.trail[stop:]
+        del self.trail_lim[level:]
+        del self.decisions[level:]
+        self.qhead = min(self.qhead, stop)
+
+    # unit propagation with two watched literals, returns a conflict clause or None
+    def _propagate(self):
+        values = self.values
+        while self.qhead < len(self.trail):
+            false_lit = -self.trail[self.qhead]
+            self.qhead += 1
+            self.stats["propagations"] += 1
+            watch_list = self.watches[false_lit]
+            kept = []
+            for i, c in enumerate(watch_list):
+                if c[0] == false_lit:
+                    c[0], c[1] = c[1], c[0]
+                # clause already satisfied by the other watch
+                if values[c[0]] == 1:
+                    kept.append(c)
+                    continue
+                # look for a new literal to watch
+                for k in range(2, len(c)):
+                    if values[c[k]] != -1:
+                        c[1], c[k] = c[k], c[1]
+                        self.watches[c[1]].append(c)
+                        break
+                else:
+                    kept.append(c)
+                    if values[c[0]] == -1:
+                        kept.extend(watch_list[i+1:])
+                        self.watches[false_lit] = kept
+                        return c
+                    self._assign(c[0], c)
+            self.watches[false_lit] = kept
+        return None
+
+    def _pick_branch(self):
+        for v in self.order:
+            if self.values[v] == 0:
+                if self.phase == "positive":
+                    return v
+                if self.phase == "negative":
+                    return -v
+                if self.phase == "polarity":
+                    return v if self.polarity[v] else -v
+                return v if self.random.random() < 0.5 else -v
+        return None
+
+    # resolve the conflict clause with reasons until a single literal of the
+    # conflict level is left (first unique implication point)
+    # the learnt clause is RUP, literals of level 0 are dropped
+    def _analyze(self, conflict, level):
+        seen = set()
+        learnt = []
+        pending = 0
+        lit = None
+        index = len(self.trail) - 1
+        clause = conflict
+        while True:
+            for q in clause:
+                v = abs(q)
+                if q == lit or v in seen or self.levels[v] == 0:
+                    continue
+                seen.add(v)
+                if self.levels[v] == level:
+                    pending += 1
+                else:
+                    learnt.append(q)
+            while not abs(self.trail[index]) in seen:
+                index -= 1
+            lit = self.trail[index]
+            index -= 1
+            pending -= 1
+            if pending == 0:
+                return [-lit] + learnt
+            clause = self.reasons[abs(lit)]
+
+    # learn a clause from the conflict and backjump, the cube literals (or any
+    # decision) only appear in it if they took part in the conflict
+    # returns False if the formula is unsatisfiable under the assumptions
+    def _learn(self, conflict, n_assumptions):
+        level = max(self.levels[abs(l)] for l in conflict)
+        lemma = self._analyze(conflict, level) if level > 0 else []
+        self.stats["learnt"] += 1
+        if self.proof != None:
+            self.proof.add(lemma)
+        if self.export_clause != None:
+            self.export_clause(lemma)
+        if len(lemma) == 0:
+            self.inconsistent = True
+            return False
+        # the conflict only depends on assumptions
+        if level <= n_assumptions:
+            self._backtrack(0)
+            return False
+        # backjump to the second highest level, where the lemma is unit
+        if len(lemma) == 1:
+            self._backtrack(0)
+            self._assign(lemma[0])
+            return True
+        k = max(range(1, len(lemma)), key=lambda i: self.levels[abs(lemma[i])])
+        lemma[1], lemma[k] = lemma[k], lemma[1]
+        self._backtrack(self.levels[abs(lemma[1])])
+        self.watches[lemma[0]].append(lemma)
+        self.watches[lemma[1]].append(lemma)
+        self._assign(lemma[0], lemma)
+        return True
+
+    def _restart(self):
+        self.stats["restarts"] += 1
+        self._backtrack(0)
+        if self.import_clauses != None:
+            for c in self.import_clauses():
+                self.add_clause(c)
+
+    def solve(self, assumptions=()):
+        """Search for a model extending the assumptions
+
+        Returns True if satisfiable (see model), False otherwise
+        """
+        if not metrics.enabled:
+            return self._search(list(assumptions))
+        stats = dict(self.stats)
+        with metrics.timer("solve"):
+            result = self._search(list(assumptions))
+        metrics.count_all(dict((k, v - stats[k]) for k, v in self.stats.items()))
+        return result
+
+    def _search(self, assumptions):
+        self._backtrack(0)
+        restart_count = 0
+        conflicts_left = self.restart_base * luby(restart_count)
+        steps = 0
+        while not self.inconsistent:
+            # the clock is read every 256 conflicts or decisions
+            steps += 1
+            if self.deadline != None and steps & 255 == 0 and time() > self.deadline:
+                self._backtrack(0)
+                raise Exception("deadline exceeded")
+            conflict = self._propagate()
+            if conflict != None:
+                self.stats["conflicts"] += 1
+                if not self._learn(conflict, len(assumptions)):
+                    break
+                conflicts_left -= 1
+                if self.restart_base > 0 and conflicts_left <= 0:
+                    restart_count += 1
+                    conflicts_left = self.restart_base * luby(restart_count)
+                    self._restart()
+                continue
+            level = len(self.trail_lim)
+            if level < len(assumptions):
+                lit = assumptions[level]
+                if self.values[lit] == -1:
+                    break
+                # already true assumptions still open a (dummy) level
+                self._decide(lit if self.values[lit] == 0 else None)
+                continue
+            lit = self._pick_branch()
+            if lit == None:
+                return True
+            self._decide(lit)
+        self._backtrack(0)
+        return False
+
+    # current full assignment as a list of literals, valid after solve() returned True
+    def model(self):
+        return [v if self.values[v] == 1 else -v for v in range(1, self.n_vars+1)]
+
+
+# solve a proposition, returns a {name: bool} satisfying dict or None
+# proof : optional lemma logger, see proof.DratWriter
+def solve(prop, proof=None, **options):
+    # clauses are streamed from the tree straight into the solver
+    var_names = prop.list_var_names()
+    clauses = iter_clauses(prop.iter_cnf(tautologies=False), var_names)
+    solver = Solver(len(var_names), clauses, **options)
+    solver.proof = proof
+    if solver.solve():
+        return model_to_variables(var_names, solver.model())
+    return None
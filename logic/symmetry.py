@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+
+"""
+
+Symmetry module :
+- colored graph of integer clauses (literal and clause vertices)
+- automorphism generators by partition refinement and individualization
+- lex-leader symmetry-breaking clauses added before solving
+
+"""
+
+from collections import Counter
+try:
+    from .solver import *
+except ImportError:
+    from solver import *
+
+
+# vertex colors
+LITERAL, CLAUSE = 0, 1
+
+
+# literal l is vertex 2*(|l|-1), its negation the next one, clauses follow
+def _literal_vertex(l):
+    return 2 * (abs(l) - 1) + (0 if l > 0 else 1)
+
+def _vertex_literal(u):
+    return (u // 2 + 1) * (1 if u % 2 == 0 else -1)
+
+
+# returns adjacency sets and colors of the clauses graph
+def clauses_graph(n_vars, clauses):
+    n = 2 * n_vars + len(clauses)
+    adj = [set() for _ in range(n)]
+    colors = [LITERAL] * (2 * n_vars) + [CLAUSE] * len(clauses)
+    # a literal is linked to its negation, so negations are preserved
+    for v in range(n_vars):
+        adj[2*v].add(2*v+1)
+        adj[2*v+1].add(2*v)
+    for i, c in enumerate(clauses):
+        u = 2 * n_vars + i
+        for l in c:
+            adj[u].add(_literal_vertex(l))
+            adj[_literal_vertex(l)].add(u)
+    return adj, colors
+
+
+# coarsest equitable coloring finer than colors, with canonical color numbers
+# so that isomorphic inputs get matching colors
+def refine(adj, colors):
+    n_colors = len(set(colors))
+    while True:
+        signatures = [(colors[u], tuple(sorted(colors[w] for w in adj[u])))
+                      for u in range(len(adj))]
+        ids = dict((s, i) for i, s in enumerate(sorted(set(signatures))))
+        colors = [ids[s] for s in signatures]
+        if len(ids) == n_colors:
+            return colors
+        n_colors = len(ids)
+
+# give u its own color, just before the rest of its cell
+def _individualize(colors, u):
+    colors = [2 * c + 1 for c in colors]
+    colors[u] -= 1
+    return colors
+
+# first smallest non singleton cell, None if the coloring is discrete
+def _target_cell(colors):
+    sizes = Counter(colors)
+    candidates = [(size, c) for c, size in sizes.items() if size > 1]
+    if not candidates:
+        return None
+    target = min(candidates)[1]
+    return [u for u in range(len(colors)) if colors[u] == target]
+
+def _is_automorphism(adj, perm):
+    return all(set(perm[w] for w in adj[u]) == adj[perm[u]] for u in range(len(adj)))
+
+def _orbit_roots(n, generators):
+    parent = list(range(n))
+    def root(u):
+        while parent[u] != u:
+            parent[u] = parent[parent[u]]
+            u = parent[u]
+        return u
+    for g in generators:
+        for u in range(n):
+            a, b = root(u), root(g[u])
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+    return [root(u) for u in range(n)]
+
+
+class _Budget(Exception):
+    pass
+
+
+def automorphism_generators(adj, colors, max_generators=None, max_nodes=100000):
+    """Generators of the color preserving automorphism group of a graph
+
+    Individualization-refinement search : the first path individualizes
+    the first vertex of the target cell down to a discrete coloring, then,
+    from the deepest level up, every other vertex of the target cell that is
+    not in the orbit of the first one is tried, and a leaf equivalent to the
+    first leaf gives a generator.
+
+    Parameters
+    ----------
+    adj : list of set of int
+    colors : list of int
+    max_generators : int
+        stop after that many generators, None for all
+    max_nodes : int
+        search tree nodes budget, the generators found so far are returned
+        when it is exhausted
+
+    Returns a list of permutations (lists of vertices)
+    """
+    n = len(adj)
+    colors = refine(adj, colors)
+    path = []
+    while True:
+        cell = _target_cell(colors)
+        if cell == None:
+            break
+        path.append((colors, cell))
+        colors = refine(adj, _individualize(colors, cell[0]))
+    first_leaf = dict((c, u) for u, c in enumerate(colors))
+    generators = []
+    nodes = [0]
+
+    def search(colors, level):
+        nodes[0] += 1
+        if nodes[0] > max_nodes:
+            raise _Budget()
+        # prune on invariants : cell sizes must match the first path
+        if level < len(path):
+            if Counter(colors) != Counter(path[level][0]):
+                return None
+            for u in _target_cell(colors):
+                perm = search(refine(adj, _individualize(colors, u)), level + 1)
+                if perm != None:
+                    return perm
+            return None
+        if len(set(colors)) != n:
+            return None
+        perm = [0] * n
+        for u, c in enumerate(colors):
+            perm[first_leaf[c]] = u
+        return perm if _is_automorphism(adj, perm) else None
+
+    try:
+        for level in reversed(range(len(path))):
+            colors, cell = path[level]
+            for u in cell[1:]:
+                roots = _orbit_roots(n, generators)
+                if roots[u] == roots[cell[0]]:
+                    continue
+                perm = search(refine(adj, _individualize(colors, u)), level + 1)
+                if perm != None:
+                    generators.append(perm)
+                    if max_generators != None and len(generators) >= max_generators:
+                        return generators
+    except _Budget:
+        pass
+    return generators
+
+
+# literal permutations (dict literal -> literal, identity omitted) of the clauses
+def clause_symmetries(n_vars, clauses, max_generators=None, max_nodes=100000):
+    adj, colors = clauses_graph(n_vars, clauses)
+    symmetries = []
+    for perm in automorphism_generators(adj, colors, max_generators, max_nodes):
+        sigma = {}
+        for v in range(1, n_vars+1):
+            image = _vertex_literal(perm[_literal_vertex(v)])
+            if image != v:
+                sigma[v] = image
+                sigma[-v] = -image
+        if sigma:
+            symmetries.append(sigma)
+    return symmetries
+
+
+# lex-leader clauses for x <= sigma(x), x ordered by variable index
+# the chain stops after max_length variables of the support
+# new auxiliary variables are numbered from next_var, returns (clauses, next_var)
+def lex_leader_clauses(sigma, next_var, max_length=None):
+    # x in a 2-cycle with a previous variable is equal to its image
+    # whenever the prefix is, it adds nothing to the chain
+    support = sorted(v for v in sigma if v > 0 and not
+                     (abs(sigma[v]) < v and sigma[sigma[v]] == v))
+    if max_length != None:
+        support = support[:max_length]
+    clauses = []
+    # prefix is the literal "all previous variables are equal to their image"
+    prefix = None
+    for i, x in enumerate(support):
+        y = sigma[x]
+        guard = [-prefix] if prefix != None else []
+        # x <= y when the prefix is equal
+        clauses.append(guard + [-x, y])
+        # x <= -x : x is false and the prefix cannot stay equal
+        if y == -x:
+            break
+        if i == len(support) - 1:
+            break
+        equal = next_var
+        next_var += 1
+        # prefix equal and x == y (both true or both false) : still equal
+        clauses.append(guard + [-x, equal])
+        clauses.append(guard + [x, y, equal])
+        prefix = equal
+    return clauses, next_var
+
+
+def break_symmetries(n_vars, clauses, max_generators=None, max_length=None, max_nodes=100000):
+    """Add lex-leader symmetry-breaking clauses for the detected symmetries
+
+    The result is satisfiable iff clauses are, with models restricted to
+    the lex smallest of their orbit (on the generators).
+    Returns (number of variables including auxiliary ones, clauses)
+    """
+    next_var = n_vars + 1
+    clauses = list(clauses)
+    for sigma in clause_symmetries(n_vars, clauses, max_generators, max_nodes):
+        sbp, next_var = lex_leader_clauses(sigma, next_var, max_length)
+        clauses.extend(sbp)
+    return next_var - 1, clauses
+
+
+# solve a proposition after adding symmetry-breaking clauses
+# returns a {name: bool} satisfying dict or None
+def solve_with_symmetry_breaking(prop, max_generators=None, max_length=None, **options):
+    var_names, clauses = prop_to_clauses(prop)
+    n_vars, clauses = break_symmetries(len(var_names), clauses, max_generators, max_length)
+    solver = Solver(n_vars, clauses, **options)
+    if solver.solve():
+        return model_to_variables(var_names, solver.model()[:len(var_names)])
+    return None
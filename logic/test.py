@@ -2,12 +2,52 @@
 
 """
 
-Unit testing for propositions module
+Unit testing for logic modules
 
 """
 
 import unittest
 from propositions import *
+from solver import *
+from parallel import *
+import parallel
+from proof import *
+from metrics import Metrics
+from cache import *
+from davisputnam import *
+from localsearch import *
+from simulation import *
+from symmetry import *
+from aig import *
+import asyncio
+import copy
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+# the server is in the app package, next to logic
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.server import Server, Client, LocalClient, run_batch
+
+# pigeonhole principle : n pigeons in n-1 holes, unsatisfiable
+def pigeonhole(n):
+    p = [[Variable("p{}_{}".format(i, j)) for j in range(n-1)] for i in range(n)]
+    clauses = []
+    for i in range(n):
+        clause = p[i][0]
+        for j in range(1, n-1):
+            clause = Or(clause, p[i][j])
+        clauses.append(clause)
+    for j in range(n-1):
+        for i in range(n):
+            for k in range(i+1, n):
+                clauses.append(Or(Not(p[i][j]), Not(p[k][j])))
+    prop = clauses.pop()
+    for c in clauses:
+        prop = And(prop, c)
+    return prop
 
 class TestProposition(unittest.TestCase):
     def test_T(self):
@@ -140,6 +180,28 @@ class TestProposition(unittest.TestCase):
         B = Variable("B")
         self.assertEqual(Equivalent(A, B).to_cnf(), Or(And(A, B), And(Not(A), Not(B))).to_cnf())
 
+    def test_iter_cnf(self):
+        A, B = Variable("A"), Variable("B")
+        prop = Equivalent(A, B)
+        self.assertEqual(len(list(prop.iter_cnf())), 4)
+        self.assertEqual(sorted(sorted(map(str, t)) for t in prop.iter_cnf(tautologies=False)),
+                         [["-A", "B"], ["-B", "A"]])
+        self.assertEqual(list(And(A, And(A, Or(A, A))).iter_cnf()), [[A]])
+        # negations are pushed down to the variables
+        for prop in [Not(Implies(A, B)), Not(Equivalent(A, Not(B))), Not(Or(T, A))]:
+            cnf = prop.to_cnf()
+            for variables in variable_input_possibilities(["A", "B"]):
+                self.assertEqual(prop.evaluate(variables), cnf.evaluate(variables))
+
+    def test_evaluate_vector(self):
+        A, B = Variable("A"), Variable("B")
+        columns = {'A': 0b0011, 'B': 0b0101}
+        for prop in [T, F, Not(A), And(A, B), Or(A, Not(B)), Implies(A, B), Equivalent(A, B)]:
+            result = prop.evaluate_vector(columns, 0b1111)
+            for i in range(4):
+                variables = {'A': bool(columns['A'] >> i & 1), 'B': bool(columns['B'] >> i & 1)}
+                self.assertEqual(bool(result >> i & 1), prop.evaluate(variables))
+
     def test_search_counter_example(self):
         self.assertEqual(Variable("A").search_counter_example(), {'A': False})
         self.assertEqual(Not(Variable("A")).search_counter_example(), {'A': True})
@@ -155,5 +217,659 @@ class TestProposition(unittest.TestCase):
         self.assertEqual(decode_proposition_str("Equivalent(A,A)").__class__, Equivalent)
         self.assertEqual(decode_proposition_str("Equiv(A,A)").__class__, Equivalent)
 
+class TestSolver(unittest.TestCase):
+    def test_cnf_table_to_clauses(self):
+        A, B = Variable("A"), Variable("B")
+        var_names, clauses = cnf_table_to_clauses([[A, Not(B)], [B, F], [A, T], [A, Not(A)]])
+        self.assertEqual(var_names, ["A", "B"])
+        self.assertEqual(clauses, [[1, -2], [2]])
+        self.assertEqual(clauses_to_cnf_table(var_names, clauses), [[A, Not(B)], [B]])
+
+    def test_solve(self):
+        A, B = Variable("A"), Variable("B")
+        self.assertEqual(solve(And(Or(A, B), Not(A))), {'A': False, 'B': True})
+        self.assertEqual(solve(And(A, Not(A))), None)
+        self.assertEqual(solve(pigeonhole(5)), None)
+        for heuristic in Solver.heuristics:
+            for phase in Solver.phases:
+                self.assertEqual(solve(pigeonhole(4), heuristic=heuristic,
+                                       phase=phase, seed=0, restart_base=2), None)
+
+    def test_write_dimacs(self):
+        A, B = Variable("A"), Variable("B")
+        f = io.StringIO()
+        self.assertEqual(write_dimacs(And(Or(A, Not(B)), Or(A, Not(A))), f), ["A", "B"])
+        lines = f.getvalue().split("\n")
+        self.assertEqual(lines[0].split(), ["p", "cnf", "2", "1"])
+        self.assertEqual(lines[1:], ["1 -2 0", ""])
+
+    def test_assumptions(self):
+        solver = Solver(2, [[1, 2]])
+        self.assertEqual(solver.solve([-1]), True)
+        self.assertEqual(solver.model(), [-1, 2])
+        self.assertEqual(solver.solve([-1, -2]), False)
+        self.assertEqual(solver.solve(), True)
+
+    def test_portfolio_solve(self):
+        A, B = Variable("A"), Variable("B")
+        self.assertEqual(portfolio_solve(And(Or(A, B), Not(A)), processes=2), {'A': False, 'B': True})
+        self.assertEqual(portfolio_solve(pigeonhole(5), processes=2), None)
+
+    def test_cube_and_conquer(self):
+        A, B = Variable("A"), Variable("B")
+        self.assertEqual(cube_and_conquer(And(Or(A, B), Not(A)), processes=2), {'A': False, 'B': True})
+        self.assertEqual(cube_and_conquer(pigeonhole(5), processes=2), None)
+        self.assertEqual(cube_and_conquer(pigeonhole(5), cube_vars=["p0_0"],
+                                          processes=2, exchange_size=0), None)
+
+    def test_deadline(self):
+        var_names, clauses = prop_to_clauses(pigeonhole(8))
+        solver = Solver(len(var_names), clauses, deadline=time.time() + 0.1)
+        with self.assertRaises(Exception):
+            solver.solve()
+        self.assertEqual(Solver(2, [[1, 2]], deadline=time.time() + 10).solve([-1]), True)
+
+    def test_clause_exchange(self):
+        exchange = ClauseExchange(16, 3)
+        reader = copy.copy(exchange)
+        for clause in [[1, -2], [3], [1, 2, 3, 4], []]:
+            exchange.export_clause(clause)
+        self.assertEqual(reader.import_clauses(), [[1, -2], [3]])
+        self.assertEqual(reader.import_clauses(), [])
+        # a reader more than one buffer length behind skips to the end
+        lagging = copy.copy(exchange)
+        for k in range(5):
+            exchange.export_clause([k+1, -k-2])
+        self.assertEqual(lagging.import_clauses(), [])
+        exchange.export_clause([7])
+        self.assertEqual(lagging.import_clauses(), [[7]])
+        # a registered handle does not read back its own clauses
+        writer = copy.copy(exchange)
+        writer.register()
+        reader.cursor = writer.cursor = exchange.written.value
+        writer.export_clause([8])
+        exchange.export_clause([9])
+        self.assertEqual(writer.import_clauses(), [[9]])
+        self.assertEqual(reader.import_clauses(), [[8], [9]])
+
+    def test_shared_clauses_prune(self):
+        var_names, clauses = prop_to_clauses(pigeonhole(6))
+        cubes = list(make_cubes(choose_cube_variables(clauses, 3)))
+        exchange = ClauseExchange(1 << 16, 8)
+        reader = copy.copy(exchange)
+        parallel._init_worker(len(var_names), clauses, exchange)
+        try:
+            self.assertEqual(parallel._solve_cube(cubes[0]), None)
+        finally:
+            parallel._worker.clear()
+        shared = reader.import_clauses()
+        # learnt clauses only hold the cube literals of their conflicts,
+        # they are not all satisfied by another cube
+        cube = cubes[-1]
+        self.assertTrue(any(not any(l in cube for l in c) for c in shared))
+        alone = Solver(len(var_names), clauses, restart_base=100)
+        helped = Solver(len(var_names), clauses + shared, restart_base=100)
+        self.assertFalse(alone.solve(cube))
+        self.assertFalse(helped.solve(cube))
+        self.assertLess(helped.stats["conflicts"], alone.stats["conflicts"])
+
+class TestProof(unittest.TestCase):
+    def test_drat_writer(self):
+        f = io.BytesIO()
+        with DratWriter(f, buffer_size=4) as proof:
+            proof.add([1, -2, 100])
+            proof.delete([3])
+            proof.add([])
+        self.assertEqual(f.getvalue(), b"a\x02\x05\xc8\x01\x00d\x06\x00a\x00")
+        self.assertEqual(list(read_drat(f.getvalue())),
+                         [(False, [1, -2, 100]), (True, [3]), (False, [])])
+
+    def test_check_proof(self):
+        for n in range(3, 7):
+            f = io.BytesIO()
+            with DratWriter(f) as proof:
+                self.assertEqual(solve(pigeonhole(n), proof=proof, restart_base=4), None)
+            self.assertTrue(check_proof(pigeonhole(n), f.getvalue()))
+
+    def test_check_wrong_proof(self):
+        f = io.BytesIO()
+        with DratWriter(f) as proof:
+            proof.add([1])
+            proof.add([])
+        self.assertFalse(check_drat(2, [[1, 2], [-1, 2], [1, -2]], f.getvalue()))
+        self.assertTrue(check_drat(2, [[1, 2], [-1, 2], [1, -2], [-1, -2]], f.getvalue()))
+
+    def test_check_rat(self):
+        # [1, 2] is RAT on 1 (the resolvent [2, 3] is RUP) but neither RUP
+        # nor RAT on 2, and checking [1] reorders its literals
+        clauses = [[-1, 3], [2, 3, 5], [2, 3, -5], [2, -3, 6], [2, -3, -6], [-2, 4], [-2, -4]]
+        f = io.BytesIO()
+        with DratWriter(f) as proof:
+            for c in [[1, 2], [1], [2], []]:
+                proof.add(c)
+        checker = DratChecker(6, clauses)
+        self.assertTrue(checker.check(read_drat(f.getvalue())))
+        self.assertEqual(checker.stats["rat"], 1)
+        f = io.BytesIO()
+        with DratWriter(f) as proof:
+            for c in [[2, 1], [1], [2], []]:
+                proof.add(c)
+        self.assertFalse(check_drat(6, clauses, f.getvalue()))
+
+class TestMetrics(unittest.TestCase):
+    def test_disabled(self):
+        m = Metrics()
+        m.count("clauses", 3)
+        with m.timer("stage"):
+            pass
+        m.set("clauses", 3)
+        self.assertEqual(m.to_dict(), {"counters": {}, "gauges": {}, "timers": {},
+                                       "peak_memory": {}})
+
+    def test_enabled(self):
+        m = Metrics(enabled=True)
+        m.count("clauses", 3)
+        m.count_all({"clauses": 1, "conflicts": 2})
+        @m.timed("stage")
+        def recursive(n):
+            return recursive(n-1) if n > 0 else 0
+        recursive(3)
+        d = m.to_dict()
+        self.assertEqual(d["counters"], {"clauses": 4, "conflicts": 2})
+        self.assertEqual(d["timers"]["stage"]["count"], 1)
+        self.assertIn("logicview_clauses_total 4", m.to_prometheus())
+        self.assertIn('logicview_stage_calls_total{stage="stage"} 1', m.to_prometheus())
+
+    def test_gauges(self):
+        m = Metrics(enabled=True)
+        m.set("clauses", 6)
+        m.set("clauses", 1)
+        self.assertEqual(m.to_dict()["gauges"], {"clauses": 1})
+        self.assertIn("logicview_clauses 1", m.to_prometheus())
+        self.assertEqual(m.summary(), "clauses: 1")
+
+    def test_prometheus_names(self):
+        m = Metrics(enabled=True)
+        m.count("fraig checks", 2)
+        m.count("2-sat", 1)
+        with m.timer('apply "x"'):
+            pass
+        lines = [l for l in m.to_prometheus().splitlines() if not l.startswith("#")]
+        for line in lines:
+            name = line.split("{")[0].split(" ")[0]
+            self.assertRegex(name, r"^[a-zA-Z_:][a-zA-Z0-9_:]*$")
+        self.assertIn("logicview_fraig_checks_total 2", lines)
+        self.assertIn('{stage="apply \\"x\\""}', m.to_prometheus())
+
+    def test_nested_peak_memory(self):
+        m = Metrics(enabled=True, track_memory=True)
+        try:
+            with m.timer("outer"):
+                data = bytearray(1 << 20)
+                del data
+                with m.timer("inner"):
+                    pass
+            peaks = m.to_dict()["peak_memory"]
+            # the inner stage does not wipe the peak reached before it
+            self.assertGreaterEqual(peaks["outer"], 1 << 20)
+            self.assertLess(peaks["inner"], peaks["outer"])
+        finally:
+            m.disable()
+
+class TestCache(unittest.TestCase):
+    def test_normalize_input(self):
+        self.assertEqual(input_key("A, B: Imply(A, Equiv(B, A))"),
+                         input_key("Implies(A,Equivalent(B,A))"))
+        self.assertNotEqual(input_key("Imply(A,B)"), input_key("Imply(B,A)"))
+
+    def test_clause_database(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "db.cnf")
+            write_clause_database(path, ["A", "B"], [[1, -2], [], [2]])
+            with ClauseDatabase(path) as db:
+                self.assertEqual(db.var_names, ["A", "B"])
+                self.assertEqual(len(db), 3)
+                self.assertEqual(db[0], [1, -2])
+                self.assertEqual(db.clauses(), [[1, -2], [], [2]])
+            # databases of an older conversion pipeline are not read
+            with open(path, "r+b") as f:
+                f.seek(8)
+                f.write((FORMAT_VERSION - 1).to_bytes(4, "little"))
+            with self.assertRaises(Exception):
+                ClauseDatabase(path)
+
+    def test_cnf_cache(self):
+        with tempfile.TemporaryDirectory() as d:
+            cache = CnfCache(d)
+            self.assertEqual(cache.get("Or(A,Not(B))"), None)
+            A, B = Variable("A"), Variable("B")
+            with cache.get_or_convert("Or(A,Not(B))") as db:
+                self.assertEqual(db.to_proposition(), Or(A, Not(B)))
+            with cache.get("A, B: Or(A, Not(B))") as db:
+                self.assertEqual(db.clauses(), [[1, -2]])
+            # corrupted entries are dropped
+            with open(cache.path("F"), "wb") as f:
+                f.write(b"garbage")
+            self.assertEqual(cache.get("F"), None)
+            with cache.get_or_convert("F") as db:
+                self.assertEqual(db.to_proposition(), F)
+            # least recently used entries are evicted first
+            os.utime(cache.path("F"), (0, 0))
+            cache.max_bytes = os.path.getsize(cache.path("Or(A,Not(B))"))
+            cache.evict()
+            self.assertEqual(os.listdir(d), [os.path.basename(cache.path("Or(A,Not(B))"))])
+
+class TestDavisPutnam(unittest.TestCase):
+    def test_apply_operation(self):
+        A, B = Variable("A"), Variable("B")
+        prop = And(Or(A, Not(A)), Or(A, B))
+        self.assertEqual(apply_operation(prop, "tautology", A), Or(A, B))
+        self.assertEqual(apply_operation(And(A, Or(Not(A), B)), "assigntrue", A), Or(Not(A), B))
+        self.assertEqual(apply_operation(And(A, Or(Not(A), B)), "assignfalse", A), A)
+        self.assertEqual(apply_operation(And(A, Or(A, B)), "unitpropagation", A), T)
+        self.assertEqual(apply_operation(Or(A, B), "purlitteralelimination", A), T)
+        self.assertEqual(apply_operation(Or(A, B), "unitpropagation", A), Or(A, B))
+        # a negative literal is made true, not replaced by F
+        self.assertEqual(apply_operation(And(Not(A), Or(Not(A), B)), "unitpropagation", A), T)
+        self.assertEqual(apply_operation(And(Or(Not(A), B), Or(Not(A), Not(B))),
+                                         "purlitteralelimination", A), T)
+        self.assertEqual(apply_operation(And(A, Not(A)), "unitpropagation", A), F)
+        with self.assertRaises(Exception):
+            apply_operation(A, "nope", A)
+
+    def test_parse_script(self):
+        self.assertEqual(parse_script("unitpropagation; purlitteralelimination A\nassign B=F"),
+                         [("unitpropagation", None), ("purlitteralelimination", "A"),
+                          ("assignfalse", "B")])
+        for script in ["nope", "assign A", "assign A=1", "assigntrue"]:
+            with self.assertRaises(Exception):
+                parse_script(script)
+
+    def test_run_script(self):
+        A, B, C, D = Variable("A"), Variable("B"), Variable("C"), Variable("D")
+        # a chain of units is propagated in one step
+        prop = And(A, And(Or(Not(A), B), And(Or(Not(B), C), Or(Not(C), D))))
+        self.assertEqual(run_script(prop, "unitpropagation"), T)
+        self.assertEqual(run_script(And(A, And(Not(A), B)), "unitpropagation"), F)
+        # C becomes pure once B is eliminated
+        prop = And(Or(B, C), And(Or(Not(C), D), Or(Not(D), Not(C))))
+        self.assertEqual(run_script(prop, "purlitteralelimination"), T)
+        self.assertEqual(run_script(prop, "purlitteralelimination D"), prop.to_cnf())
+        prop = And(Or(A, Not(A)), And(Or(A, B), Or(Not(A), C)))
+        self.assertEqual(run_script(prop, "tautology; assign A=T"), C)
+        self.assertEqual(run_script(prop, "assign A=F; unitpropagation"), T)
+        self.assertEqual(run_script(prop, "assign E=T"), prop.to_cnf().simplify())
+
+    def test_proof(self):
+        A, B, C = Variable("A"), Variable("B"), Variable("C")
+        prop = And(A, And(Or(Not(A), B), And(Or(Not(B), Not(A)),
+                                             And(Or(A, Not(A)), Or(C, B)))))
+        def session(steps):
+            f = io.BytesIO()
+            proof = DratLog(DratWriter(f), prop.list_var_names())
+            current = prop
+            for operation, variable in steps:
+                if variable == None:
+                    current = run_script(current, operation, proof)
+                else:
+                    current = apply_operation(current, operation, Variable(variable), proof)
+            proof.writer.close()
+            return current, proof, f.getvalue()
+        # manual, scripted and mixed sessions ending in F
+        for steps in [[("tautology", "A"), ("purlitteralelimination", "C"),
+                       ("unitpropagation", "A"), ("unitpropagation", "B")],
+                      [("tautology; purlitteralelimination; unitpropagation", None)],
+                      [("unitpropagation", "A"), ("unitpropagation", None)]]:
+            current, proof, data = session(steps)
+            self.assertEqual(current, F)
+            self.assertTrue(proof.available)
+            self.assertIn((False, []), list(read_drat(data)))
+            self.assertTrue(check_proof(prop, data))
+        # branching leaves the session without a proof
+        current, proof, data = session([("assigntrue", "B"), ("unitpropagation", "A")])
+        self.assertFalse(proof.available)
+        current, proof, data = session([("assign B=T; unitpropagation", None)])
+        self.assertFalse(proof.available)
+
+class TestLocalSearch(unittest.TestCase):
+    def test_counters(self):
+        clauses = [[1, 2, -3], [-1, 3], [2, 3], [-2, -3], [1, -2]]
+        ls = LocalSearch(3, clauses, seed=0)
+        ls._init_assignment()
+        for v in [1, 3, 2, 2, 1, 3]:
+            ls.flip(v)
+            true_lits = [[l for l in c if ls.values[abs(l)] == (l > 0)] for c in clauses]
+            self.assertEqual(sorted(ls.unsat), [c for c, t in enumerate(true_lits) if not t])
+            for v in range(1, 4):
+                self.assertEqual(ls.breaks[v], sum(1 for t in true_lits if t in [[v], [-v]]))
+                self.assertEqual(ls.makes[v], sum(1 for c, t in zip(clauses, true_lits)
+                                                  if not t and (v in c or -v in c)))
+
+    def test_local_search(self):
+        A, B, C = Variable("A"), Variable("B"), Variable("C")
+        prop = And(Or(A, B), And(Or(Not(A), C), Or(Not(B), Not(C))))
+        for algorithm in LocalSearch.algorithms:
+            model = local_search(prop, algorithm=algorithm, seed=1)
+            self.assertTrue(prop.evaluate(model))
+        self.assertEqual(local_search(And(A, Not(A)), max_flips=100), None)
+
+    def test_solve_with_local_search(self):
+        self.assertEqual(solve_with_local_search(pigeonhole(4), {"max_flips": 100}), None)
+        A, B = Variable("A"), Variable("B")
+        self.assertEqual(solve_with_local_search(And(A, Not(B))), {'A': True, 'B': False})
+
+class TestSimulation(unittest.TestCase):
+    def test_simulate_csv(self):
+        prop = decode_proposition_str("Imply(A, B)")
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "data.csv")
+            with open(path, "w") as f:
+                f.write("B,C,A\n")
+                for i in range(20):
+                    f.write("{},1,{}\n".format(i % 2, "true" if i % 3 == 0 else "false"))
+            mask_path = os.path.join(d, "mask.bin")
+            result = simulate(prop, path, mask_path=mask_path, max_violations=2, chunk_size=8)
+            # failing rows : A and not B, i.e. i % 3 == 0 and i % 2 == 0
+            self.assertEqual(result.rows, 20)
+            self.assertEqual(result.failures, 4)
+            self.assertEqual(result.violations, [(0, {'A': True, 'B': False}),
+                                                 (6, {'A': True, 'B': False})])
+            with open(mask_path, "rb") as f:
+                mask = f.read()
+            self.assertEqual([i for i in range(20) if not mask[i // 8] >> (i % 8) & 1],
+                             [0, 6, 12, 18])
+            with self.assertRaises(Exception):
+                simulate(decode_proposition_str("D"), path)
+            self.assertEqual(simulate(proposition_to_aig(prop), path).failures, 4)
+            violations_path = os.path.join(d, "violations.csv")
+            simulate(prop, path, max_violations=2, violations_path=violations_path)
+            with open(violations_path) as f:
+                self.assertEqual(f.read().split(), ["row,A,B", "0,1,0", "6,1,0"])
+
+    # rows i : A if i % 3 == 0, B if i % 2 == 1, C always
+    def npy_rows(self, n):
+        return [(i % 3 == 0, i % 2 == 1, True) for i in range(n)]
+
+    def check_npy_result(self, result, mask_path):
+        self.assertEqual((result.rows, result.failures), (20, 4))
+        self.assertEqual(result.violations, [(0, {'A': True, 'B': False}),
+                                             (6, {'A': True, 'B': False}),
+                                             (12, {'A': True, 'B': False})])
+        with open(mask_path, "rb") as f:
+            mask = f.read()
+        self.assertEqual(len(mask), 3)
+        self.assertEqual([i for i in range(20) if not mask[i // 8] >> (i % 8) & 1],
+                         [0, 6, 12, 18])
+
+    @unittest.skipUnless(numpy, "numpy is not installed")
+    def test_simulate_npy_structured(self):
+        prop = decode_proposition_str("Imply(A, B)")
+        data = numpy.array(self.npy_rows(20), dtype=[("A", bool), ("B", bool), ("C", bool)])
+        with tempfile.TemporaryDirectory() as d:
+            path, mask_path = os.path.join(d, "data.npy"), os.path.join(d, "mask.bin")
+            numpy.save(path, data)
+            # violations found across chunks
+            result = simulate(prop, path, mask_path=mask_path, max_violations=3, chunk_size=8)
+            self.check_npy_result(result, mask_path)
+            with self.assertRaises(Exception):
+                simulate(decode_proposition_str("D"), path)
+
+    @unittest.skipUnless(numpy, "numpy is not installed")
+    def test_simulate_npy_2d(self):
+        prop = decode_proposition_str("Imply(A, B)")
+        data = numpy.array(self.npy_rows(20), dtype=numpy.uint8)
+        with tempfile.TemporaryDirectory() as d:
+            path, mask_path = os.path.join(d, "data.npy"), os.path.join(d, "mask.bin")
+            numpy.save(path, data)
+            result = simulate(prop, path, mask_path=mask_path, max_violations=3, chunk_size=8,
+                              column_names=["A", "B", "C"])
+            self.check_npy_result(result, mask_path)
+            # column names are required, one per column
+            for column_names in [None, ["A", "B"]]:
+                with self.assertRaises(Exception):
+                    simulate(prop, path, column_names=column_names)
+            # the AIG evaluates numpy columns as well
+            result = simulate(proposition_to_aig(prop), path, column_names=["A", "B", "C"])
+            self.assertEqual(result.failures, 4)
+
+class TestSymmetry(unittest.TestCase):
+    def test_automorphism_generators(self):
+        # 4-cycle : the dihedral group is generated by 2 permutations
+        adj = [{1, 3}, {0, 2}, {1, 3}, {0, 2}]
+        generators = automorphism_generators(adj, [0, 0, 0, 0])
+        self.assertEqual(len(generators), 2)
+        for perm in generators:
+            for u in range(4):
+                self.assertEqual(set(perm[w] for w in adj[u]), adj[perm[u]])
+
+    def test_clause_symmetries(self):
+        # A and B are interchangeable
+        symmetries = clause_symmetries(3, [[1, 2], [-1, 3], [-2, 3]])
+        self.assertEqual(symmetries, [{1: 2, -1: -2, 2: 1, -2: -1}])
+        self.assertEqual(clause_symmetries(2, [[1], [1, 2]]), [])
+
+    def test_lex_leader_clauses(self):
+        self.assertEqual(lex_leader_clauses({1: 2, -1: -2, 2: 1, -2: -1}, 3),
+                         ([[-1, 2]], 3))
+        self.assertEqual(lex_leader_clauses({1: -1, -1: 1}, 2), ([[-1, -1]], 2))
+
+    def test_break_symmetries(self):
+        for n in range(3, 7):
+            var_names, clauses = prop_to_clauses(pigeonhole(n))
+            n_vars, broken = break_symmetries(len(var_names), clauses)
+            self.assertGreater(len(broken), len(clauses))
+            self.assertFalse(Solver(n_vars, broken).solve())
+        A, B, C = Variable("A"), Variable("B"), Variable("C")
+        prop = And(Or(A, B), And(Or(Not(A), C), Or(Not(B), C)))
+        model = solve_with_symmetry_breaking(prop)
+        self.assertTrue(prop.evaluate(model))
+
+class TestAIG(unittest.TestCase):
+    def assertSameFunction(self, aig, prop):
+        var_names = prop.list_var_names()
+        for variables in variable_input_possibilities(var_names):
+            self.assertEqual(aig.evaluate(variables), prop.evaluate(variables))
+
+    def test_and(self):
+        aig = AIG()
+        a, b, c = aig.input("A"), aig.input("B"), aig.input("C")
+        # structural hashing
+        self.assertEqual(aig.and_(a, b), aig.and_(b, a))
+        self.assertEqual(aig.n_ands(), 1)
+        self.assertEqual(aig.and_(a, negate(a)), FALSE)
+        self.assertEqual(aig.and_(a, TRUE), a)
+        # two level rules
+        ab = aig.and_(a, b)
+        self.assertEqual(aig.and_(ab, negate(a)), FALSE)
+        self.assertEqual(aig.and_(ab, a), ab)
+        self.assertEqual(aig.and_(negate(ab), negate(a)), negate(a))
+        self.assertEqual(aig.and_(negate(ab), a), aig.and_(a, negate(b)))
+        self.assertEqual(aig.and_(negate(ab), negate(aig.and_(a, negate(b)))), negate(a))
+        self.assertEqual(aig.and_(ab, aig.and_(negate(a), c)), FALSE)
+
+    def test_proposition_to_aig(self):
+        A, B, C = Variable("A"), Variable("B"), Variable("C")
+        props = [And(Or(A, Not(B)), Implies(C, A)), Equivalent(Implies(A, B), Or(Not(A), B)),
+                 Equivalent(A, Equivalent(B, C)), Or(And(A, F), Not(T))]
+        for prop in props:
+            aig = proposition_to_aig(prop)
+            self.assertSameFunction(aig, prop)
+            self.assertSameFunction(optimize(aig, seed=0), prop)
+        # repeated subformulas are shared
+        x = Equivalent(A, Or(B, C))
+        self.assertEqual(proposition_to_aig(And(x, Implies(A, x))).cleanup().n_ands(),
+                         proposition_to_aig(x).n_ands())
+
+    def test_rewrite(self):
+        A, B, C, D = Variable("A"), Variable("B"), Variable("C"), Variable("D")
+        # A /\ B \/ A /\ C is rebuilt as A /\ (B \/ C)
+        aig = proposition_to_aig(Or(And(A, B), And(A, C)))
+        self.assertEqual((aig.cleanup().n_ands(), aig.rewrite().n_ands()), (3, 2))
+        props = [Or(And(A, B), And(A, C)), Equivalent(Implies(A, Or(B, C)), And(Or(C, D), A)),
+                 Or(And(Or(A, B), Or(A, C)), And(Not(A), Equivalent(B, D)))]
+        for prop in props:
+            aig = proposition_to_aig(prop)
+            rewritten = aig.rewrite()
+            self.assertLessEqual(rewritten.n_ands(), aig.cleanup().n_ands())
+            self.assertSameFunction(rewritten, prop)
+        # shared nodes reused by the new structure are not counted as saved
+        aig = proposition_to_aig(And(Or(And(A, B), And(A, C)), Or(And(A, B), D)))
+        self.assertSameFunction(aig.rewrite(), And(Or(And(A, B), And(A, C)), Or(And(A, B), D)))
+
+    def test_balance(self):
+        names = ["X{}".format(i) for i in range(16)]
+        prop = Variable(names[0])
+        for name in names[1:]:
+            prop = And(prop, Variable(name))
+        aig = proposition_to_aig(prop)
+        self.assertEqual(aig.depth(), 15)
+        balanced = aig.balance()
+        self.assertEqual(balanced.depth(), 4)
+        self.assertEqual(balanced.n_ands(), 15)
+        self.assertEqual(balanced.evaluate(dict((name, True) for name in names)), True)
+        # only supergate roots are rebuilt, a long chain balances in linear time
+        aig = AIG()
+        lit = aig.input("X0")
+        for i in range(1, 4096):
+            lit = aig.and_(lit, aig.input("X{}".format(i)))
+        aig.outputs.append(lit)
+        balanced = aig.balance()
+        self.assertEqual(balanced.depth(), 12)
+        self.assertEqual(balanced.n_ands(), 4095)
+
+    def test_fraig(self):
+        A, B, C = Variable("A"), Variable("B"), Variable("C")
+        # same function, different structures
+        x, y = And(A, And(B, C)), And(And(C, A), B)
+        self.assertEqual(proposition_to_aig(Equivalent(x, y)).fraig(seed=0).outputs, [TRUE])
+        aig = proposition_to_aig(Or(And(Implies(A, B), Implies(B, A)), Equivalent(A, B)))
+        fraiged = aig.fraig(seed=0)
+        self.assertLess(fraiged.n_ands(), aig.cleanup().n_ands())
+        self.assertSameFunction(fraiged, Equivalent(A, B))
+
+    def test_to_clauses(self):
+        A, B = Variable("A"), Variable("B")
+        aig = proposition_to_aig(And(A, Equivalent(A, Not(B))))
+        n_vars, clauses = aig.to_clauses()
+        solver = Solver(n_vars, clauses)
+        self.assertTrue(solver.solve())
+        self.assertEqual(model_to_variables(aig.list_var_names(), solver.model()[:2]),
+                         {'A': True, 'B': False})
+        self.assertEqual(proposition_to_aig(And(A, Not(A))).to_clauses(), (1, [[]]))
+        # a supergate of 4 inputs : one variable, 5 clauses, and the output
+        aig = proposition_to_aig(decode_proposition_str("And(A,And(B,And(C,D)))"))
+        self.assertEqual(aig.to_clauses(), (5, [[-5, 4], [-5, 3], [-5, 2], [-5, 1],
+                                                [5, -4, -3, -2, -1], [5]]))
+
+    def test_solve_with_aig(self):
+        self.assertEqual(solve_with_aig(pigeonhole(4)), None)
+        prop = decode_proposition_str("And(Equiv(A,B),And(Imply(B,C),Not(C)))")
+        self.assertEqual(solve_with_aig(prop, fraig=True), {'A': False, 'B': False, 'C': False})
+
+    def test_evaluate_vector(self):
+        prop = decode_proposition_str("Equiv(Imply(A,B),Or(C,A))")
+        columns = {"A": 0b11110000, "B": 0b11001100, "C": 0b10101010}
+        self.assertEqual(proposition_to_aig(prop).evaluate_vector(columns, 0xff),
+                         prop.evaluate_vector(columns, 0xff))
+        with self.assertRaises(Exception):
+            proposition_to_aig(prop).evaluate_vector({"A": 1}, 1)
+
+class TestServer(unittest.TestCase):
+    requests = [("parse", {"formula": "Imply(A,B)"}),
+                ("to_cnf", {"formula": "Imply(A,B)"}),
+                ("check_theorem", {"formula": "Or(A,Not(A))"}),
+                ("check_theorem", {"formula": "Imply(A,B)"}),
+                ("solve", {"formula": "And(A,Not(B))"}),
+                ("solve", {"formula": "And(A,Not(A))"}),
+                ("apply", {"formula": "And(A,Or(Not(A),B))", "operation": "assigntrue",
+                           "variable": "A"}),
+                ("apply", {"clauses": [["A"], ["-A", "B"]], "operation": "unitpropagation",
+                           "variable": "A"}),
+                ("script", {"clauses": [["A"], ["-A", "B"]], "script": "assign A=T"})]
+    # And of 30 Or, the CNF of its negation has 2^30 clauses
+    slow = "Or(A0,B0)"
+    for i in range(1, 30):
+        slow = "And({},Or(A{},B{}))".format(slow, i, i)
+
+    def test_run_batch(self):
+        responses = run_batch([{"id": 1, "op": "solve", "formula": "And(A,Not(B))"},
+                               {"id": 2, "op": "solve", "formula": "A", "expires": 0},
+                               {"id": 3, "op": "nope"},
+                               {"id": 4, "op": "parse", "formula": "And(A"}])
+        self.assertEqual(responses[0], {"id": 1, "result": {"satisfiable": True,
+                                                            "model": {"A": True, "B": False}}})
+        self.assertEqual(responses[1], {"id": 2, "error": "deadline exceeded"})
+        self.assertEqual([sorted(r) for r in responses[2:]], [["error", "id"], ["error", "id"]])
+        # the session keeps the clauses, solving again gives the same answer
+        self.assertEqual(run_batch([{"id": 1, "op": "solve", "formula": "And(A,Not(B))"}]),
+                         responses[:1])
+        # the deadline stops the work itself
+        start = time.time()
+        for op, formula in [("check_theorem", self.slow), ("to_cnf", "Not({})".format(self.slow))]:
+            self.assertEqual(run_batch([{"id": 1, "op": op, "formula": formula,
+                                         "expires": time.time() + 0.2}]),
+                             [{"id": 1, "error": "deadline exceeded"}])
+        self.assertLess(time.time() - start, 10)
+
+    def test_server(self):
+        async def main(path):
+            server = Server(workers=2, max_pending=2)
+            await server.start(path)
+            try:
+                client = await Client().connect(path)
+                local = LocalClient()
+                # every op, LocalClient stands in for Client
+                for op, params in self.requests:
+                    self.assertEqual(await client.request(op, **params),
+                                     await local.request(op, **params))
+                # concurrent requests, more than max_pending, are batched
+                results = await asyncio.gather(*[client.request("solve", formula=f)
+                                                 for f in ["A", "Not(A)"] * 20])
+                self.assertEqual([r["model"] for r in results], [{"A": True}, {"A": False}] * 20)
+                with self.assertRaises(Exception):
+                    await client.request("solve", formula="A", deadline=0)
+                with self.assertRaises(Exception):
+                    await client.request("solve", formula="A", deadline="x")
+                with self.assertRaises(Exception):
+                    await client.request("nope")
+                await client.close()
+                # malformed requests get an error line
+                reader, writer = await asyncio.open_unix_connection(path)
+                writer.write(b"not json\n[1]\n")
+                for _ in range(2):
+                    response = json.loads(await reader.readline())
+                    self.assertEqual(response["id"], None)
+                    self.assertIn("Invalid request", response["error"])
+                writer.close()
+            finally:
+                await server.close()
+        with tempfile.TemporaryDirectory() as d:
+            asyncio.run(main(os.path.join(d, "server.sock")))
+
+    def test_server_deadline(self):
+        async def main(path):
+            # one worker, its queue holds 2 requests
+            server = Server(workers=1, max_pending=4, max_queued=2)
+            await server.start(path)
+            try:
+                clients = [await Client().connect(path) for _ in range(3)]
+                start = time.time()
+                slow = clients[0].request("check_theorem", formula=self.slow, deadline=0.5)
+                # requests of every connection wait for room in the queue,
+                # then for the worker to give up the expired request
+                fast = [c.request("parse", formula="And(A,B{})".format(i), deadline=20)
+                        for c in clients for i in range(6)]
+                results = await asyncio.gather(slow, *fast, return_exceptions=True)
+                self.assertEqual(str(results[0]), "deadline exceeded")
+                self.assertEqual([r["variables"] for r in results[1:]],
+                                 [["A", "B{}".format(i)] for c in clients for i in range(6)])
+                self.assertLess(time.time() - start, 10)
+                for client in clients:
+                    await client.close()
+            finally:
+                await server.close()
+        with tempfile.TemporaryDirectory() as d:
+            asyncio.run(main(os.path.join(d, "server.sock")))
+
 if __name__ == "__main__":
     unittest.main()